@@ -0,0 +1,205 @@
+from collections import OrderedDict, deque
+import asyncio, math, time
+
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse
+
+import auth, config, database, metrics
+
+WAIT_SECONDS = metrics.Histogram('quiz_admission_wait_seconds', 'Time spent waiting for admission')
+REJECTED = metrics.Counter('quiz_admission_rejected_total', 'Requests turned away before reaching the app', ['reason', 'route_class'])
+
+# health checks, metrics and docs never queue
+_EXEMPT = ('/docs', '/redoc', '/openapi.json', '/metrics')
+
+class Rejected(Exception):
+	def __init__(self, status_code: int, reason: str, retry_after: float) -> None:
+		super().__init__(reason)
+		self.status_code = status_code
+		self.reason = reason
+		self.retry_after = retry_after
+
+class TokenBuckets():
+	"""
+	LRU of token buckets keyed by client, refilled lazily when they are taken from.
+	"""
+
+	def __init__(self, rate: float, burst: float, maxsize: int) -> None:
+		self.rate = rate
+		self.burst = burst
+		self.maxsize = maxsize
+		self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+	def __len__(self) -> int:
+		return len(self._buckets)
+
+	def take(self, key: str) -> float:
+		"""
+		Takes a token from the client's bucket.
+
+		:param key: The client key.
+		:return: 0 when a token was taken, otherwise the seconds until one is available.
+		"""
+
+		now = time.monotonic()
+		tokens, updated = self._buckets.pop(key, (self.burst, now))
+		tokens = min(self.burst, tokens + (now - updated) * self.rate)
+
+		retry_after = 0.0
+		if tokens >= 1:
+			tokens -= 1
+		else:
+			retry_after = (1 - tokens) / self.rate
+
+		self._buckets[key] = (tokens, now)
+		if len(self._buckets) > self.maxsize:
+			self._buckets.popitem(last=False)
+
+		return retry_after
+
+class AdmissionGate():
+	"""
+	Caps the requests served at once, queueing up to ``queue_limit`` more for at most ``timeout`` seconds.
+
+	A released slot is handed to the oldest waiter, or to a priority waiter first.
+	"""
+
+	def __init__(self, limit: int, queue_limit: int, timeout: float) -> None:
+		self.limit = limit
+		self.queue_limit = queue_limit
+		self.timeout = timeout
+
+		self.active = 0
+		self._waiters: deque[asyncio.Future] = deque()
+
+	@property
+	def waiting(self) -> int:
+		return len(self._waiters)
+
+	async def enter(self, priority: bool = False) -> None:
+		if self.active < self.limit and not self._waiters:
+			self.active += 1
+			return
+
+		if len(self._waiters) >= self.queue_limit:
+			raise Rejected(status.HTTP_429_TOO_MANY_REQUESTS, 'queue_full', self.timeout)
+
+		waiter = asyncio.get_running_loop().create_future()
+		if priority:
+			self._waiters.appendleft(waiter)
+		else:
+			self._waiters.append(waiter)
+
+		try:
+			await asyncio.wait_for(waiter, self.timeout)
+		except BaseException as e:
+			# the slot may have been handed over just as the wait ended
+			if waiter.done() and not waiter.cancelled():
+				self.release()
+			elif waiter in self._waiters:
+				self._waiters.remove(waiter)
+
+			if isinstance(e, asyncio.TimeoutError):
+				raise Rejected(status.HTTP_503_SERVICE_UNAVAILABLE, 'queue_timeout', self.timeout)
+			raise
+
+	def release(self) -> None:
+		while self._waiters:
+			waiter = self._waiters.popleft()
+			if not waiter.done():
+				waiter.set_result(None)
+				return
+
+		self.active -= 1
+
+gate = AdmissionGate(config.admission_limit or database.POOL_LIMIT, config.admission_queue, config.admission_timeout)
+buckets = {
+	route_class: TokenBuckets(rate, burst, config.rate_limit_clients)
+	for route_class, (rate, burst) in config.rate_limits.items()
+}
+
+def _route_class(method: str, path: str) -> str:
+	if method == 'POST' and path in ('/token', '/user'):
+		return 'login'
+
+	if method == 'POST' and path.startswith('/student/'):
+		return 'submit'
+
+	return 'read'
+
+def _bearer(scope) -> str | None:
+	for name, value in scope['headers']:
+		if name == b'authorization':
+			scheme, _, token = value.decode('latin-1').partition(' ')
+			return token if scheme.lower() == 'bearer' and token else None
+
+	return None
+
+def _client_key(scope, token: str | None, principal: auth.Principal | None) -> str:
+	if principal is not None:
+		return principal.uid
+
+	# the signature is checked before trusting the token's user, so forged tokens share their address's bucket
+	if token:
+		try:
+			payload = auth.decode_jwt(token)
+			return payload.get('uid') or payload['sub']
+		except HTTPException:
+			pass
+
+	return (scope.get('client') or ('?',))[0]
+
+class AdmissionMiddleware():
+	"""
+	ASGI middleware bounding the requests in front of the database pool.
+
+	Every client has a token bucket per route class (login, read, submit),
+	keyed by the user of a validly signed token and by client address
+	otherwise. Requests over their rate, or arriving when the wait queue is
+	full, get an immediate 429 with Retry-After. Admins skip the rate limits
+	and jump the queue, so they stay responsive when a class saturates the API.
+	"""
+
+	def __init__(self, app) -> None:
+		self.app = app
+
+	async def __call__(self, scope, receive, send) -> None:
+		path = scope.get('path', '')
+
+		if scope['type'] != 'http' or scope['method'] == 'OPTIONS' or path == '/' or path.startswith(_EXEMPT):
+			await self.app(scope, receive, send)
+			return
+
+		route_class = _route_class(scope['method'], path)
+
+		token = _bearer(scope)
+		principal = auth.principal_cache.peek(token) if token else None
+		priority = principal is not None and principal.is_admin
+
+		try:
+			if not priority:
+				retry_after = buckets[route_class].take(_client_key(scope, token, principal))
+				if retry_after:
+					raise Rejected(status.HTTP_429_TOO_MANY_REQUESTS, 'rate_limited', retry_after)
+
+			start = time.perf_counter()
+			try:
+				await gate.enter(priority)
+			finally:
+				WAIT_SECONDS.observe(time.perf_counter() - start)
+
+		except Rejected as e:
+			REJECTED.labels(e.reason, route_class).inc()
+
+			response = JSONResponse(
+				{'detail': 'Too many requests' if e.status_code == status.HTTP_429_TOO_MANY_REQUESTS else 'Server busy'},
+				status_code=e.status_code,
+				headers={'Retry-After': str(max(1, math.ceil(e.retry_after)))}
+			)
+			await response(scope, receive, send)
+			return
+
+		try:
+			await self.app(scope, receive, send)
+		finally:
+			gate.release()
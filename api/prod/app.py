@@ -1,13 +1,43 @@
+import startup
+
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
 
 from fastapi import FastAPI, status
 from fastapi.responses import Response, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
-import router
+import admission, database, metrics, router, serve
+
+startup.timer.mark('imports')
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+	async with database.get_engine().connect():
+		pass
+	startup.timer.mark('engine_connect')
+
+	await database.warm_up()
+	startup.timer.mark('pool_warmup')
+
+	await database.autosave.start(adopt=serve.orphaned_journals())
+	startup.timer.mark('autosave_replay')
+
+	await database.bus.start()
+	startup.timer.mark('cache_bus')
+
+	startup.timer.ready()
+
+	yield
+
+	await database.bus.stop()
+	await database.autosave.stop()
+	await database.dispose_engine()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
+# inside CORS, so rejections still carry its headers
+app.add_middleware(admission.AdmissionMiddleware)
 app.add_middleware(
 	CORSMiddleware,
 	allow_origins=['*'],
@@ -15,6 +45,8 @@ app.add_middleware(
 	allow_methods=['*'],
 	allow_headers=['*']
 )
+app.add_middleware(database.ProfileMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
 
 @app.get('/', include_in_schema=False)
 async def root() -> Response:
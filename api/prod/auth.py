@@ -1,5 +1,8 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
-import re
+from typing import Callable, TypeVar
+import asyncio, re, time
 
 from fastapi import HTTPException, status, Path, Query
 from fastapi.security import OAuth2PasswordBearer
@@ -11,9 +14,46 @@ import database
 
 oauth2 = OAuth2PasswordBearer(tokenUrl='token')
 
-def bcrypt_hash(password: str) -> str:
+T = TypeVar('T')
+
+class HashPool():
+	"""
+	Runs bcrypt calls on worker threads so they never block the event loop.
+
+	bcrypt releases the GIL while hashing, so ``workers`` caps how many hashes
+	run at once, and at most ``queue_limit`` calls may be pending (running or
+	waiting) before new ones are rejected with 503.
+	"""
+
+	def __init__(self, workers: int, queue_limit: int) -> None:
+		self.workers = workers
+		self.queue_limit = queue_limit
+		self.pending = 0
+		self.rejected = 0
+		self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+
+	async def run(self, fn: Callable[..., T], *args) -> T:
+		if self.pending >= self.queue_limit:
+			self.rejected += 1
+			raise HTTPException(
+				status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+				detail='Too many pending authentication requests',
+				headers={'Retry-After': '1'}
+			)
+
+		self.pending += 1
+		try:
+			loop = asyncio.get_running_loop()
+			return await loop.run_in_executor(self._executor, fn, *args)
+		finally:
+			self.pending -= 1
+
+hash_pool = HashPool(config.hash_workers, config.hash_queue_limit)
+
+def bcrypt_hash(password: str, rounds: int | None = None) -> str:
 	pwd_bytes = password.encode('utf-8')
-	hash_bytes = bcrypt.hashpw(password=pwd_bytes, salt=bcrypt.gensalt())
+	salt = bcrypt.gensalt(rounds=rounds or config.bcrypt_rounds)
+	hash_bytes = bcrypt.hashpw(password=pwd_bytes, salt=salt)
 
 	return hash_bytes.decode('utf-8')
 
@@ -23,19 +63,167 @@ def bcrypt_verify(password: str, hashed: str) -> bool:
 
 	return bcrypt.checkpw(password=password_enc, hashed_password=hashed_enc)
 
-def create_jwt(username: str, expire_mins: int = 30) -> str:
+def bcrypt_needs_rehash(hashed: str) -> bool:
+	try:
+		rounds = int(hashed.split('$')[2])
+	except (IndexError, ValueError):
+		return True
+
+	return rounds != config.bcrypt_rounds
+
+async def hash_password(password: str) -> str:
+	return await hash_pool.run(bcrypt_hash, password)
+
+async def verify_password(password: str, hashed: str) -> bool:
+	return await hash_pool.run(bcrypt_verify, password, hashed)
+
+class Principal():
+	__slots__ = ('uid', 'username', 'is_admin')
+
+	def __init__(self, uid: str, username: str, is_admin: bool) -> None:
+		self.uid = uid
+		self.username = username
+		self.is_admin = is_admin
+
+class PrincipalCache():
+	"""
+	LRU cache of verified tokens and the principal they resolve to.
+
+	Tokens carry the user's ``token_version``. Their claims are only trusted when
+	it matches the last version known for the user, learned from the database or
+	recorded by ``invalidate_user`` when the user changes (promotion, deletion),
+	which also evicts their tokens. Tokens of users without a known version, e.g.
+	after a restart, are resolved against the database. At most ``maxsize``
+	versions are kept.
+	"""
+
+	def __init__(self, maxsize: int) -> None:
+		self.maxsize = maxsize
+		self.hits = 0
+		self.misses = 0
+		self._tokens: OrderedDict[str, tuple[Principal, float]] = OrderedDict()
+		self._by_uid: dict[str, set[str]] = {}
+		self._versions: OrderedDict[str, int | None] = OrderedDict()
+
+	def __len__(self) -> int:
+		return len(self._tokens)
+
+	def get(self, token: str) -> Principal | None:
+		entry = self._tokens.get(token)
+		if entry is None:
+			self.misses += 1
+			return None
+
+		principal, expire = entry
+		if expire <= time.time():
+			self.misses += 1
+			self._drop(token)
+			return None
+
+		self.hits += 1
+		self._tokens.move_to_end(token)
+		return principal
+
+	def peek(self, token: str) -> Principal | None:
+		"""
+		Returns the principal of a cached, unexpired token without counting a hit or miss or refreshing it.
+		"""
+
+		entry = self._tokens.get(token)
+		if entry is None or entry[1] <= time.time():
+			return None
+
+		return entry[0]
+
+	def put(self, token: str, principal: Principal, expire: float) -> None:
+		self._tokens[token] = (principal, expire)
+		self._tokens.move_to_end(token)
+		self._by_uid.setdefault(principal.uid, set()).add(token)
+
+		while len(self._tokens) > self.maxsize:
+			self._drop(next(iter(self._tokens)))
+
+	def trusted(self, uid: str, version: int) -> bool:
+		if uid not in self._versions:
+			return False
+
+		self._versions.move_to_end(uid)
+		return self._versions[uid] == version
+
+	def learn(self, uid: str, version: int) -> None:
+		"""
+		Records the version of a user read from the database, unless a change recorded meanwhile is newer.
+		"""
+
+		if uid not in self._versions:
+			self._record(uid, version)
+
+	def invalidate_user(self, uid: str, version: int | None = None) -> None:
+		self._record(uid, version)
+
+		for token in list(self._by_uid.get(uid, ())):
+			self._drop(token)
+
+	def clear(self) -> None:
+		"""
+		Evicts every token, keeping the recorded versions so tokens of changed users stay untrusted.
+		"""
+
+		self._tokens.clear()
+		self._by_uid.clear()
+
+	def _record(self, uid: str, version: int | None) -> None:
+		self._versions[uid] = version
+		self._versions.move_to_end(uid)
+
+		while len(self._versions) > self.maxsize:
+			self._versions.popitem(last=False)
+
+	def _drop(self, token: str) -> None:
+		entry = self._tokens.pop(token, None)
+		if entry is None:
+			return
+
+		tokens = self._by_uid.get(entry[0].uid)
+		if tokens is not None:
+			tokens.discard(token)
+			if not tokens:
+				del self._by_uid[entry[0].uid]
+
+principal_cache = PrincipalCache(config.principal_cache_size)
+
+def _user_changed(pk: list | None, version: int | None) -> None:
+	if pk is None:
+		principal_cache.clear()
+	elif pk:
+		principal_cache.invalidate_user(pk[0], version)
+
+# users changed by other workers, e.g. promoted or deleted
+database.bus.subscribe(database.models.User.__name__, _user_changed)
+database.bus.on_reset(principal_cache.clear)
+
+def create_jwt(
+	username: str,
+	uid: str | None = None,
+	is_admin: bool = False,
+	version: int = 0,
+	expire_mins: int = 30
+) -> str:
 	assert config.jwt_secret_key and config.jwt_algorithm
 
 	expire = datetime.now(timezone.utc) + timedelta(minutes=expire_mins)
 	payload = {
 		'sub': username,
+		'uid': uid,
+		'adm': is_admin,
+		'ver': version,
 		'exp': expire
 	}
 
 	encoded_jwt = jwt.encode(payload, config.jwt_secret_key, algorithm=config.jwt_algorithm)
 	return encoded_jwt
 
-def decode_jwt(token: str) -> str:
+def decode_jwt(token: str) -> dict:
 	assert config.jwt_secret_key and config.jwt_algorithm
 
 	try:
@@ -48,7 +236,7 @@ def decode_jwt(token: str) -> str:
 		if username is None:
 			raise JWTError('Invalid username in token')
 
-		return username
+		return payload
 
 	except ExpiredSignatureError:
 		raise HTTPException(
@@ -64,13 +252,16 @@ def decode_jwt(token: str) -> str:
 			headers={'WWW-Authenticate': 'Bearer'}
 		)
 
-async def jwt2user(db: database.DB, token: str, admin: bool = False) -> database.models.User:
-	username = decode_jwt(token)
+async def _load_principal(db: database.DB, payload: dict) -> Principal:
+	uid, version = payload.get('uid'), payload.get('ver')
 
-	db_user = await db.query_item(
-		database.models.User,
-		username=username
-	)
+	if uid is not None and version is not None and principal_cache.trusted(uid, version):
+		return Principal(uid, payload['sub'], bool(payload.get('adm')))
+
+	if uid is not None:
+		db_user = await db.query_item(database.models.User, cache=True, uid=uid)
+	else:
+		db_user = await db.query_item(database.models.User, username=payload['sub'])
 
 	if not db_user:
 		raise HTTPException(
@@ -79,27 +270,49 @@ async def jwt2user(db: database.DB, token: str, admin: bool = False) -> database
 			headers={'WWW-Authenticate': 'Bearer'}
 		)
 
-	if admin and not db_user.is_admin:
+	principal_cache.learn(db_user.uid, db_user.token_version)
+
+	return Principal(db_user.uid, db_user.username, db_user.is_admin)
+
+async def jwt2user(db: database.DB, token: str, admin: bool = False) -> Principal:
+	principal = principal_cache.get(token)
+
+	if principal is None:
+		payload = decode_jwt(token)
+		principal = await _load_principal(db, payload)
+		principal_cache.put(token, principal, float(payload['exp']))
+
+	if admin and not principal.is_admin:
 		raise HTTPException(
 			status_code=status.HTTP_403_FORBIDDEN,
 			detail='Admin access required',
 			headers={'WWW-Authenticate': 'Bearer'}
 		)
 
-	return db_user
+	return principal
 
-def check_sanity(target: str, path_op: bool = True, str_op: bool = True, comment_op: bool = True) -> bool:
-	path_op_pattern = re.compile(r'\.\.|/|\\')			# check: .., /, \
-	str_op_pattern = re.compile(r'["\']')				# check: ", '
-	comment_op_pattern = re.compile(r'#|--|/\*|\*/')	# check: #, --, /*, */
+def invalidate_user(uid: str, version: int | None = None) -> None:
+	"""
+	Evicts cached tokens of a user after a change to their account.
+
+	:param uid: The user uid.
+	:param version: The user's new token_version, or None when the user was deleted.
+	"""
+
+	principal_cache.invalidate_user(uid, version)
 
-	if path_op and path_op_pattern.search(target):
+_path_op_pattern = re.compile(r'\.\.|/|\\')			# check: .., /, \
+_str_op_pattern = re.compile(r'["\']')				# check: ", '
+_comment_op_pattern = re.compile(r'#|--|/\*|\*/')	# check: #, --, /*, */
+
+def check_sanity(target: str, path_op: bool = True, str_op: bool = True, comment_op: bool = True) -> bool:
+	if path_op and _path_op_pattern.search(target):
 		return False
 
-	if str_op and str_op_pattern.search(target):
+	if str_op and _str_op_pattern.search(target):
 		return False
 
-	if comment_op and comment_op_pattern.search(target):
+	if comment_op and _comment_op_pattern.search(target):
 		return False
 
 	return True
@@ -1,6 +1,34 @@
 import os
 
+def _rate(value: str) -> tuple[float, float]:
+	rate, _, burst = value.partition(',')
+	return float(rate), float(burst or rate)
+
 jwt_algorithm = 'HS256'
 jwt_secret_key = os.getenv('JWT_SECRET')
 
 admin_pw = os.getenv('ADMIN_PW')
+
+bcrypt_rounds = int(os.getenv('BCRYPT_ROUNDS', '12'))
+hash_workers = int(os.getenv('HASH_WORKERS', '4'))
+hash_queue_limit = int(os.getenv('HASH_QUEUE_LIMIT', '256'))
+
+principal_cache_size = int(os.getenv('PRINCIPAL_CACHE_SIZE', '4096'))
+
+workers = int(os.getenv('WORKERS', '1'))
+max_requests = int(os.getenv('MAX_REQUESTS', '0'))	# 0 never recycles workers
+max_requests_jitter = int(os.getenv('MAX_REQUESTS_JITTER', '0'))
+node_id = int(os.getenv('NODE_ID', '0'))	# first TSID node of this container, workers use node_id + index
+
+admission_limit = int(os.getenv('ADMISSION_LIMIT', '0'))	# requests served at once, 0 for as many as the database pool has connections
+admission_queue = int(os.getenv('ADMISSION_QUEUE', '256'))	# requests waiting beyond the limit
+admission_timeout = float(os.getenv('ADMISSION_TIMEOUT', '5'))
+
+# requests per second and burst, per client and route class; logins are keyed by address,
+# where a whole class may sign up and log in at once behind one NAT
+rate_limits = {
+	'login': _rate(os.getenv('RATE_LIMIT_LOGIN', '10,250')),
+	'read': _rate(os.getenv('RATE_LIMIT_READ', '20,40')),
+	'submit': _rate(os.getenv('RATE_LIMIT_SUBMIT', '5,20'))
+}
+rate_limit_clients = int(os.getenv('RATE_LIMIT_CLIENTS', '65536'))
@@ -1,8 +1,35 @@
-from ._session import DB, provide_db
+from ._config import PAGE_LIMIT, POOL_LIMIT
+from ._session import DB, Page, QueryBudgetExceeded, provide_db
+from ._engine import get_engine, dispose_engine, pool_status, warm_up
+from ._migrate import migrate
+from ._profile import Profile, ProfileMiddleware
+from ._compiled import quiz_cache
+from ._autosave import AutosaveBuffer, autosave
+from ._bus import InvalidationBus, bus
 from . import models
+from . import compiled
+from . import grading
 
 __all__ = [
 	'models',
+	'compiled',
+	'grading',
 	'DB',
+	'Page',
+	'PAGE_LIMIT',
+	'POOL_LIMIT',
+	'Profile',
+	'ProfileMiddleware',
+	'QueryBudgetExceeded',
 	'provide_db',
+	'get_engine',
+	'dispose_engine',
+	'pool_status',
+	'warm_up',
+	'migrate',
+	'quiz_cache',
+	'AutosaveBuffer',
+	'autosave',
+	'InvalidationBus',
+	'bus',
 ]
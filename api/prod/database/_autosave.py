@@ -0,0 +1,294 @@
+from typing import Mapping, TextIO
+import asyncio, json, logging, os
+
+from sqlalchemy import tuple_, update
+
+from . import _config as cfg
+from ._models import Assignment, Submission
+from ._session import DB
+
+ASSIGNMENT = tuple[str, str]	# (user uid, quiz uid)
+
+logger = logging.getLogger(__name__)
+
+class AutosaveBuffer():
+	"""
+	Write-behind buffer of in-progress answers, coalesced per assignment and question.
+
+	Every change is appended to a local journal before it is acknowledged, and the
+	journal is replayed on start, so buffered answers survive a worker crash.
+	Pending answers are written with one upsert per flush, every ``interval``
+	seconds or once ``batch`` answers are pending. The buffer belongs to the
+	process: anything that reads submissions for scoring must flush it first,
+	so it is only ``enabled`` when one process serves every request. Journals
+	are replayed on start either way.
+	"""
+
+	def __init__(self, directory: str, interval: float, batch: int, enabled: bool = True) -> None:
+		self.directory = directory
+		self.interval = interval
+		self.batch = batch
+		self.enabled = enabled
+
+		self.flushes = 0
+		self.flushed = 0
+		self.failures = 0
+
+		# None marks an answer dropped after it was buffered, e.g. by an explicit submit
+		self._pending: dict[ASSIGNMENT, dict[str, str | None]] = {}
+		self._revisions: dict[ASSIGNMENT, int] = {}
+		self._count = 0
+
+		self._segment = 0
+		self._journal: TextIO | None = None
+		self._sealed: list[str] = []
+
+		self._lock = asyncio.Lock()
+		self._wake = asyncio.Event()
+		self._task: asyncio.Task | None = None
+
+	def __len__(self) -> int:
+		return self._count
+
+	def put(self, user_uid: str, quiz_uid: str, answers: Mapping[str, str | None]) -> None:
+		"""
+		Buffers answer changes of an assignment, replacing earlier changes to the same questions.
+
+		:param user_uid: The user uid.
+		:param quiz_uid: The quiz uid.
+		:param answers: The selected answer uid keyed by question uid, or None to drop a buffered answer.
+		"""
+
+		if not answers:
+			return
+
+		journal = self._journal or self._open()
+		journal.write(''.join(
+			json.dumps([user_uid, quiz_uid, question_uid, answer_uid], separators=(',', ':')) + '\n'
+			for question_uid, answer_uid in answers.items()
+		))
+		journal.flush()
+
+		self._apply(user_uid, quiz_uid, answers)
+
+		if self._count >= self.batch:
+			self._wake.set()
+
+	def discard(self, user_uid: str, quiz_uid: str, question_uids: list[str] | None = None) -> None:
+		"""
+		Drops buffered answers so a later flush does not overwrite answers written directly.
+
+		:param question_uids: The questions to drop, or None for every buffered answer of the assignment, e.g. once it is graded.
+		"""
+
+		pending = self._pending.get((user_uid, quiz_uid), {})
+
+		if question_uids is None:
+			question_uids = list(pending)
+
+		# a running flush may have taken older answers to these questions; it skips them once it sees the drop
+		if not self._lock.locked():
+			question_uids = [uid for uid in question_uids if pending.get(uid) is not None]
+
+		self.put(user_uid, quiz_uid, {uid: None for uid in question_uids})
+
+	def pending(self, user_uid: str, quiz_uid: str) -> dict[str, str]:
+		"""
+		Returns the buffered answer uids of an assignment keyed by question uid.
+		"""
+
+		pending = self._pending.get((user_uid, quiz_uid), {})
+
+		return {question_uid: answer_uid for question_uid, answer_uid in pending.items() if answer_uid is not None}
+
+	def revision(self, user_uid: str, quiz_uid: str) -> int:
+		"""
+		Returns a counter of the changes buffered for an assignment since the process started.
+		"""
+
+		return self._revisions.get((user_uid, quiz_uid), 0)
+
+	async def flush(self) -> int:
+		"""
+		Writes every pending answer with a single upsert and bumps the version of the affected assignments.
+
+		On failure the answers are buffered again, behind any change made in the meantime.
+		Answers changed or dropped while the flush waited for an assignment's lock,
+		e.g. by a submit, are left to the next flush so the newer write wins.
+
+		:return: The number of written answers.
+		"""
+
+		async with self._lock:
+			if not self._pending and not self._sealed:
+				return 0
+
+			taken, self._pending, self._count = self._pending, {}, 0
+			self._seal()
+			sealed = list(self._sealed)
+
+			rows = [
+				{'user_uid': user_uid, 'quiz_uid': quiz_uid, 'question_uid': question_uid, 'answer_uid': answer_uid}
+				for (user_uid, quiz_uid), answers in taken.items()
+				for question_uid, answer_uid in answers.items()
+				if answer_uid is not None
+			]
+
+			try:
+				if rows:
+					await self._write(rows)
+			except BaseException:
+				self.failures += 1
+				for key, answers in taken.items():
+					self._pending[key] = answers | self._pending.get(key, {})
+				self._count = sum(len(answers) for answers in self._pending.values())
+				raise
+
+			for path in sealed:
+				os.remove(path)
+			self._sealed.clear()
+
+			self.flushes += 1
+			self.flushed += len(rows)
+
+			return len(rows)
+
+	async def start(self, adopt: list[str] | None = None) -> None:
+		"""
+		Replays the journal left by a previous process, flushes it and starts the flush timer.
+
+		:param adopt: Journal directories of processes that no longer exist, replayed before this buffer's own.
+		"""
+
+		os.makedirs(self.directory, exist_ok=True)
+
+		for directory in [*(adopt or []), self.directory]:
+			if not os.path.isdir(directory):
+				continue
+
+			for name in sorted(os.listdir(directory)):
+				if not name.endswith('.ndjson'):
+					continue
+
+				path = os.path.join(directory, name)
+				if directory == self.directory:
+					self._segment = max(self._segment, int(name.split('.')[0]))
+				self._sealed.append(path)
+
+				with open(path, 'r', encoding='utf-8') as f:
+					for line in f:
+						# a crash can leave the last line half written
+						try:
+							user_uid, quiz_uid, question_uid, answer_uid = json.loads(line)
+						except ValueError:
+							continue
+
+						self._apply(user_uid, quiz_uid, {question_uid: answer_uid}, count_revision=False)
+
+		if self._sealed:
+			logger.info('Replaying %d buffered answers from %d journal segments', self._count, len(self._sealed))
+
+			try:
+				await self.flush()
+			except Exception:
+				logger.exception('Autosave replay failed, retrying on the next flush')
+
+		self._task = asyncio.create_task(self._run())
+
+	async def stop(self) -> None:
+		"""
+		Stops the flush timer and flushes what is left.
+		"""
+
+		if self._task is not None:
+			self._task.cancel()
+			await asyncio.gather(self._task, return_exceptions=True)
+			self._task = None
+
+		await self.flush()
+
+		if self._journal is not None:
+			self._journal.close()
+			self._journal = None
+
+	async def _run(self) -> None:
+		while True:
+			try:
+				await asyncio.wait_for(self._wake.wait(), self.interval)
+			except asyncio.TimeoutError:
+				pass
+
+			self._wake.clear()
+
+			try:
+				await self.flush()
+			except Exception:
+				logger.exception('Autosave flush failed, %d answers remain buffered', self._count)
+
+	async def _write(self, rows: list[dict]) -> None:
+		assignments = list({(row['user_uid'], row['quiz_uid']) for row in rows})
+
+		async with DB() as db:
+			# graded assignments keep the answers they were scored with; the update also
+			# locks the others, so grading waits for this flush instead of racing it
+			result = await db.session.execute(
+				update(Assignment)
+				.where(
+					tuple_(Assignment.user_uid, Assignment.quiz_uid).in_(assignments),
+					Assignment.completed.is_(False)
+				)
+				.values(version=Assignment.version + 1)
+				.returning(Assignment.user_uid, Assignment.quiz_uid)
+				.execution_options(synchronize_session=False)
+			)
+			open_assignments = {tuple(row) for row in result.all()}
+
+			skipped = len(assignments) - len(open_assignments)
+			if skipped:
+				logger.info('Dropping autosaved answers of %d graded assignments', skipped)
+
+			# with the locks held, changes buffered since the answers were taken are newer than them
+			await db.upsert_many(Submission, [
+				{k: row[k] for k in ('user_uid', 'question_uid', 'answer_uid')}
+				for row in rows
+				if (row['user_uid'], row['quiz_uid']) in open_assignments and
+				row['question_uid'] not in self._pending.get((row['user_uid'], row['quiz_uid']), {})
+			], update=['answer_uid'])
+
+			# readers tag question pages with the assignment version
+			for assignment in open_assignments:
+				db.invalidate(Assignment, assignment)
+
+	def _apply(
+		self,
+		user_uid: str,
+		quiz_uid: str,
+		answers: Mapping[str, str | None],
+		count_revision: bool = True
+	) -> None:
+		key = (user_uid, quiz_uid)
+		pending = self._pending.setdefault(key, {})
+
+		self._count += sum(question_uid not in pending for question_uid in answers)
+		pending.update(answers)
+
+		if count_revision:
+			self._revisions[key] = self._revisions.get(key, 0) + 1
+
+	def _open(self) -> TextIO:
+		os.makedirs(self.directory, exist_ok=True)
+
+		self._segment += 1
+		self._journal = open(os.path.join(self.directory, f'{self._segment:010d}.ndjson'), 'a', encoding='utf-8')
+
+		return self._journal
+
+	def _seal(self) -> None:
+		if self._journal is None:
+			return
+
+		self._journal.close()
+		self._sealed.append(self._journal.name)
+		self._journal = None
+
+autosave = AutosaveBuffer(cfg.AUTOSAVE_DIR, cfg.AUTOSAVE_INTERVAL, cfg.AUTOSAVE_BATCH, cfg.AUTOSAVE_BUFFER)
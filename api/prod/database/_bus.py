@@ -0,0 +1,176 @@
+from typing import Callable
+import asyncio, json, logging, os, secrets
+
+import asyncpg
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import _config as cfg
+
+EVENT = tuple[str, list | None, int | None]	# (model, primary key, [] for inserted rows or None for every row, version or None)
+HANDLER = Callable[[list | None, int | None], None]
+
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+_PAYLOAD_LIMIT = 7000
+
+logger = logging.getLogger(__name__)
+
+class InvalidationBus():
+	"""
+	Keeps the in-process caches of every worker coherent through Postgres LISTEN/NOTIFY.
+
+	Units of work publish the (model, key, version) of the rows they wrote with
+	``pg_notify`` inside their own transaction, so other workers only hear of a
+	write once it is committed. Each worker listens on one dedicated connection
+	and evicts matching entries through the handlers subscribed per model. Events
+	sent while a worker was disconnected are lost, so every cache is reset when
+	the connection is re-established.
+	"""
+
+	def __init__(self, dsn: str, channel: str, enabled: bool = True, health_interval: float = 30) -> None:
+		self.dsn = dsn
+		self.channel = channel
+		self.enabled = enabled
+		self.health_interval = health_interval
+
+		self.connected = False
+		self.published = 0
+		self.received = 0
+		self.reconnects = 0
+
+		self._sender = ''
+		self._handlers: dict[str, list[HANDLER]] = {}
+		self._resets: list[Callable[[], None]] = []
+		self._task: asyncio.Task | None = None
+
+	def subscribe(self, model: str, handler: HANDLER) -> None:
+		"""
+		Calls a handler with the key and version of every remote write to a model.
+
+		:param model: The model class name.
+		:param handler: Called with the primary key as a list, an empty list when rows were only inserted, or None when every row may have changed, and the row version, or None when the row was deleted or is not versioned.
+		"""
+
+		self._handlers.setdefault(model, []).append(handler)
+
+	def on_reset(self, handler: Callable[[], None]) -> None:
+		"""
+		Calls a handler to drop everything it caches when events may have been missed.
+		"""
+
+		self._resets.append(handler)
+
+	async def publish(self, session: AsyncSession, events: list[EVENT]) -> None:
+		"""
+		Queues events in the session's transaction, to be delivered when it commits.
+
+		:param session: The session holding the transaction of the write.
+		:param events: The written rows.
+		"""
+
+		if not self.enabled or not events:
+			return
+
+		conn = await session.connection()
+
+		for payload in self._payloads(events):
+			await conn.execute(text('SELECT pg_notify(:channel, :payload)'), {'channel': self.channel, 'payload': payload})
+			self.published += 1
+
+	async def start(self) -> None:
+		if not self.enabled:
+			return
+
+		# per process, so a worker skips the events it published itself
+		self._sender = f'{os.getpid()}.{secrets.token_hex(4)}'
+		self._task = asyncio.create_task(self._listen())
+
+	async def stop(self) -> None:
+		if self._task is not None:
+			self._task.cancel()
+			await asyncio.gather(self._task, return_exceptions=True)
+			self._task = None
+
+	def _payloads(self, events: list[EVENT]):
+		chunk: list[str] = []
+		size = 0
+
+		for event in dict.fromkeys(json.dumps(event, separators=(',', ':')) for event in events):
+			if chunk and size + len(event) > _PAYLOAD_LIMIT:
+				yield f'["{self._sender}",[{",".join(chunk)}]]'
+				chunk, size = [], 0
+
+			chunk.append(event)
+			size += len(event) + 1
+
+		if chunk:
+			yield f'["{self._sender}",[{",".join(chunk)}]]'
+
+	async def _listen(self) -> None:
+		delay = 1.0
+		connected_before = False
+
+		while True:
+			try:
+				conn = await asyncpg.connect(self.dsn)
+			except (OSError, asyncpg.PostgresError) as e:
+				logger.warning('Cache bus could not connect (%s), retrying in %.0f s', e, delay)
+				await asyncio.sleep(delay)
+				delay = min(delay * 2, 30)
+				continue
+
+			lost = asyncio.Event()
+
+			try:
+				conn.add_termination_listener(lambda _: lost.set())
+				await conn.add_listener(self.channel, self._receive)
+
+				self.connected = True
+				delay = 1.0
+
+				if connected_before:
+					self.reconnects += 1
+					logger.info('Cache bus reconnected, resetting caches')
+					self._reset()
+				connected_before = True
+
+				while not lost.is_set():
+					try:
+						await asyncio.wait_for(lost.wait(), self.health_interval)
+					except asyncio.TimeoutError:
+						# a silent network failure does not terminate the connection
+						await conn.execute('SELECT 1', timeout=self.health_interval)
+
+			except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+				logger.warning('Cache bus connection lost (%s)', e)
+
+			finally:
+				self.connected = False
+				if not conn.is_closed():
+					conn.terminate()
+
+	def _receive(self, _conn, _pid: int, _channel: str, payload: str) -> None:
+		try:
+			sender, events = json.loads(payload)
+		except ValueError:
+			logger.warning('Ignoring malformed cache bus payload %r', payload[:100])
+			return
+
+		if sender == self._sender:
+			return
+
+		for model, key, version in events:
+			self.received += 1
+
+			for handler in self._handlers.get(model, ()):
+				handler(key, version)
+
+	def _reset(self) -> None:
+		for handler in self._resets:
+			handler()
+
+bus = InvalidationBus(
+	cfg.PG_URL.replace('postgresql+asyncpg://', 'postgresql://', 1),
+	cfg.CACHE_BUS_CHANNEL,
+	cfg.CACHE_BUS
+)
@@ -0,0 +1,230 @@
+from collections import OrderedDict
+from hashlib import sha256
+from typing import Any
+import asyncio, time
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import DeclarativeBase, make_transient_to_detached
+from sqlalchemy.sql import Select
+
+from ._flight import SingleFlight
+
+class _Entry():
+	__slots__ = ('model', 'rows', 'identities', 'expires', 'is_list')
+
+	def __init__(self, model: type, rows: list[dict], identities: list[tuple], expires: float, is_list: bool):
+		self.model = model
+		self.rows = rows
+		self.identities = identities
+		self.expires = expires
+		self.is_list = is_list
+
+class QueryCache():
+	"""
+	LRU + TTL cache of query results, invalidated by model and primary key.
+
+	Entries hold column snapshots rather than live ORM instances, so a cached
+	result never carries state from the session that produced it. Relationships
+	are not cached and must be loaded by the caller when needed.
+
+	Misses are loaded through ``flight``. Invalidating a model detaches its
+	in-flight loads and bumps its epoch, so a load that read the old rows
+	neither serves later callers nor caches its result.
+	"""
+
+	def __init__(self, maxsize: int, ttl: float) -> None:
+		self.maxsize = maxsize
+		self.ttl = ttl
+
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.expirations = 0
+		self.invalidations = 0
+
+		self._entries: OrderedDict[str, _Entry] = OrderedDict()
+		self._by_identity: dict[tuple, set[str]] = {}
+		self._by_model: dict[type, set[str]] = {}
+		self._next_sweep = time.monotonic() + ttl
+
+		self.flight = SingleFlight()
+		self._loading: dict[type, set[str]] = {}
+		self._epochs: dict[type, int] = {}
+		self._epoch = 0
+
+	def __len__(self) -> int:
+		return len(self._entries)
+
+	@staticmethod
+	def key(stmt: Select) -> str:
+		"""
+		Builds a cache key from the compiled statement and its bound parameters.
+		"""
+
+		compiled = stmt.compile()
+		params = sorted((k, repr(v)) for k, v in compiled.params.items())
+
+		return sha256(f'{compiled}\x00{params}'.encode()).hexdigest()
+
+	def get(self, key: str) -> list[DeclarativeBase] | None:
+		entry = self._entries.get(key)
+
+		if entry is None:
+			self.misses += 1
+			return None
+
+		if entry.expires < time.monotonic():
+			self.expirations += 1
+			self.misses += 1
+			self._drop(key)
+			return None
+
+		self.hits += 1
+		self._entries.move_to_end(key)
+
+		return [_restore(entry.model, row) for row in entry.rows]
+
+	def epoch(self, model: type) -> tuple[int, int]:
+		return self._epoch, self._epochs.get(model, 0)
+
+	def begin(self, key: str, model: type) -> tuple[asyncio.Future, tuple[int, int]]:
+		"""
+		Leads the load of a missed statement. The leader must settle the returned future with ``end``.
+
+		:return: The future of the load and the model's epoch, to pass to ``put``.
+		"""
+
+		self._loading.setdefault(model, set()).add(key)
+
+		return self.flight.begin(key), self.epoch(model)
+
+	def end(self, key: str, model: type, future: asyncio.Future, result=None, error: BaseException | None = None) -> None:
+		self.flight.end(key, future, result, error)
+
+		# a newer load of the statement may have started since this one was detached
+		if self.flight.pending(key) is None:
+			keys = self._loading.get(model)
+			if keys is not None:
+				keys.discard(key)
+				if not keys:
+					del self._loading[model]
+
+	def put(self, key: str, model: type, items: list[Any], is_list: bool, epoch: tuple[int, int] | None = None) -> None:
+		"""
+		Caches the result of a statement.
+
+		:param epoch: The model's epoch when the statement ran. The result is dropped if the model was invalidated since.
+		"""
+
+		if epoch is not None and epoch != self.epoch(model):
+			return
+
+		now = time.monotonic()
+		if now >= self._next_sweep:
+			self.sweep(now)
+
+		if key in self._entries:
+			self._drop(key)
+
+		mapper = inspect(model)
+		columns = [attr.key for attr in mapper.column_attrs]
+
+		rows = [{col: getattr(item, col) for col in columns} for item in items]
+		identities = [(model, tuple(mapper.primary_key_from_instance(item))) for item in items]
+
+		self._entries[key] = _Entry(model, rows, identities, now + self.ttl, is_list)
+
+		for identity in identities:
+			self._by_identity.setdefault(identity, set()).add(key)
+
+		if is_list:
+			self._by_model.setdefault(model, set()).add(key)
+
+		while len(self._entries) > self.maxsize:
+			oldest = next(iter(self._entries))
+			self.evictions += 1
+			self._drop(oldest)
+
+	def invalidate(self, model: type, pk: tuple | None = None) -> None:
+		"""
+		Drops cached results that may contain stale rows of a model.
+
+		List results of the model are always dropped, since a write can change
+		their membership. Item results are dropped by primary key, none of them
+		when pk is empty since rows were only inserted, or all of them when pk is
+		None. In-flight loads of the model are detached either way.
+
+		:param model: The written model.
+		:param pk: The primary key of the written row.
+		"""
+
+		keys = set(self._by_model.get(model, ()))
+
+		if pk is None:
+			keys.update(
+				key
+				for key, entry in self._entries.items()
+				if entry.model is model
+			)
+		else:
+			keys.update(self._by_identity.get((model, pk), ()))
+
+		for key in keys:
+			self.invalidations += 1
+			self._drop(key)
+
+		for key in self._loading.pop(model, ()):
+			self.flight.forget(key)
+
+		self._epochs[model] = self._epochs.get(model, 0) + 1
+
+	def sweep(self, now: float | None = None) -> None:
+		now = time.monotonic() if now is None else now
+
+		for key in [k for k, entry in self._entries.items() if entry.expires < now]:
+			self.expirations += 1
+			self._drop(key)
+
+		self._next_sweep = now + self.ttl / 4
+
+	def clear(self) -> None:
+		self._entries.clear()
+		self._by_identity.clear()
+		self._by_model.clear()
+
+		self.flight.clear()
+		self._loading.clear()
+		self._epoch += 1
+
+	def stats(self) -> dict[str, int]:
+		return {
+			'entries': len(self._entries),
+			'hits': self.hits,
+			'misses': self.misses,
+			'evictions': self.evictions,
+			'expirations': self.expirations,
+			'invalidations': self.invalidations
+		}
+
+	def _drop(self, key: str) -> None:
+		entry = self._entries.pop(key, None)
+		if entry is None:
+			return
+
+		for identity in entry.identities:
+			keys = self._by_identity.get(identity)
+			if keys is not None:
+				keys.discard(key)
+				if not keys:
+					del self._by_identity[identity]
+
+		if entry.is_list:
+			keys = self._by_model.get(entry.model)
+			if keys is not None:
+				keys.discard(key)
+
+def _restore(model: type, row: dict) -> Any:
+	item = model(**row)
+	make_transient_to_detached(item)
+
+	return item
@@ -0,0 +1,427 @@
+from __future__ import annotations
+from array import array
+from collections import OrderedDict
+from hashlib import blake2b
+import random, struct, sys
+
+import respond
+
+from . import _config as cfg
+from ._bus import bus
+from ._flight import SingleFlight
+from ._models import Quiz, Question, rng_seed
+from ._session import DB
+
+_PERM_HEADER = struct.Struct('<HH')
+_PERM_MAX = 0xffff
+
+class CompiledAnswer:
+	__slots__ = ('uid', 'text', 'correct', 'encoded')
+
+	def __init__(self, uid: str, text: str, correct: bool) -> None:
+		self.uid = uid
+		self.text = text
+		self.correct = correct
+		self.encoded = respond.encode(self.dump())
+
+	def dump(self) -> dict:
+		return {
+			'text': self.text,
+			'correct': self.correct
+		}
+
+class CompiledQuestion:
+	__slots__ = ('uid', 'text', 'answers', 'answer_uids', 'key', '_text_encoded')
+
+	def __init__(self, uid: str, text: str, answers: tuple[CompiledAnswer, ...]) -> None:
+		self.uid = uid
+		self.text = text
+		self.answers = answers
+		self.answer_uids = tuple(answer.uid for answer in answers)
+		self.key = next((i for i, answer in enumerate(answers) if answer.correct), -1)
+		self._text_encoded = respond.encode(text)
+
+	def index(self, answer_uid: str) -> int:
+		return self.answer_uids.index(answer_uid)
+
+	def dump(self, order: tuple[int, ...] | None = None) -> dict:
+		if order is None:
+			order = tuple(range(len(self.answers)))
+
+		return {
+			'text': self.text,
+			'answers': [self.answers[i].dump() for i in order]
+		}
+
+	def encode(self, order: tuple[int, ...], selected: int | None = None) -> bytes:
+		"""
+		Encodes the question as JSON from the pre-encoded text and answers.
+
+		:param order: The display order of the answers.
+		:param selected: The selected answer index to include, or None to omit the field.
+		:return: The encoded JSON object.
+		"""
+
+		encoded = (
+			b'{"text":' + self._text_encoded +
+			b',"answers":[' + b','.join(self.answers[i].encoded for i in order) + b']'
+		)
+
+		if selected is not None:
+			encoded += b',"selected":' + str(selected).encode()
+
+		return encoded + b'}'
+
+class CompiledQuiz:
+	"""
+	Read-only snapshot of a quiz with its questions and answers.
+
+	Questions and answers are stored as tuples sorted by uid, so a snapshot can
+	be shared between requests without touching the ORM session.
+	"""
+
+	__slots__ = (
+		'uid',
+		'title',
+		'question_count',
+		'per_page',
+		'shuffle_questions',
+		'shuffle_answers',
+		'questions',
+		'question_uids',
+		'correct_uids',
+		'stride',
+		'encoded',
+		'version',
+		'_pages'
+	)
+
+	def __init__(self, db_quiz: Quiz) -> None:
+		self.uid = db_quiz.uid
+		self.title = db_quiz.title
+		self.question_count = db_quiz.question_count
+		self.per_page = db_quiz.per_page
+		self.shuffle_questions = db_quiz.shuffle_questions
+		self.shuffle_answers = db_quiz.shuffle_answers
+
+		self.questions = tuple(
+			_compile_question(db_question)
+			for db_question
+			in sorted(db_quiz.questions, key=lambda q: q.uid)
+		)
+		self.question_uids = tuple(q.uid for q in self.questions)
+		self.correct_uids = frozenset(
+			question.answer_uids[question.key]
+			for question in self.questions
+			if question.key >= 0
+		)
+		self.stride = max((len(q.answers) for q in self.questions), default=0)
+
+		self.encoded = respond.encode(self.dump())
+		self.version = self._digest()
+		self._pages: dict[int, bytes] = {}
+
+	def _digest(self) -> str:
+		digest = blake2b(self.encoded, digest_size=8)
+		for question in self.questions:
+			digest.update(question.uid.encode())
+			digest.update(question.encode(tuple(range(len(question.answers)))))
+
+		return digest.hexdigest()
+
+	def permute(self, seed: int | None = None) -> bytes:
+		"""
+		Builds the packed question order and answer permutations for an assignment.
+
+		The result is a little-endian uint16 array laid out as
+		``[count, stride, order[count], answers[count * stride]]``, where ``order``
+		holds indices into ``questions`` and each question position owns a fixed
+		``stride`` slot of answer indices, so any page can be read without decoding
+		the whole array.
+
+		:param seed: The assignment seed. A random seed is used when omitted.
+		:return: The packed permutation.
+		"""
+
+		question_count = self.question_count
+
+		if not 0 <= question_count <= len(self.questions):
+			raise ValueError('Question count must be between 0 and the number of questions')
+
+		if len(self.questions) > _PERM_MAX or self.stride > _PERM_MAX:
+			raise ValueError('Quiz is too large to be permuted')
+
+		if seed is None:
+			seed = rng_seed()
+
+		rng = random.Random(seed)
+
+		order = rng.sample(range(len(self.questions)), question_count)
+		if not self.shuffle_questions:
+			order.sort()
+
+		packed = array('H', (question_count, self.stride))
+		packed.extend(order)
+
+		for idx in order:
+			answers = list(range(len(self.questions[idx].answers)))
+			if self.shuffle_answers:
+				rng.shuffle(answers)
+
+			packed.extend(answers)
+			packed.extend([0] * (self.stride - len(answers)))
+
+		if sys.byteorder != 'little':
+			packed.byteswap()
+
+		return packed.tobytes()
+
+	def permuted(self, permutation: bytes | None) -> bool:
+		"""
+		Checks whether a packed permutation was built for this quiz layout.
+		"""
+
+		if not permutation or len(permutation) < _PERM_HEADER.size:
+			return False
+
+		count, stride = _PERM_HEADER.unpack_from(permutation)
+		size = _PERM_HEADER.size + 2 * count * (stride + 1)
+
+		return count == self.question_count and stride == self.stride and len(permutation) == size
+
+	def q_select(
+		self,
+		page: int = 0,
+		permutation: bytes | None = None
+	) -> list[tuple[CompiledQuestion, tuple[int, ...]]]:
+		"""
+		Selects the questions of a page along with the display order of their answers.
+
+		:param page: The 0-based page index.
+		:param permutation: The packed permutation of the assignment. When omitted, every question is returned in uid order with unshuffled answers.
+		:return: A list of (question, answer order) pairs.
+		"""
+
+		if permutation is None:
+			questions = self.questions[self.per_page * page:self.per_page * (page + 1)]
+			return [(q, tuple(range(len(q.answers)))) for q in questions]
+
+		count, stride = _PERM_HEADER.unpack_from(permutation)
+
+		idx_l = min(self.per_page * page, count)
+		idx_r = min(self.per_page * (page + 1), count)
+
+		order_offset = _PERM_HEADER.size + 2 * idx_l
+		order = struct.unpack_from(f'<{idx_r - idx_l}H', permutation, order_offset)
+
+		selected = []
+		for pos, idx in enumerate(order, start=idx_l):
+			question = self.questions[idx]
+			answer_offset = _PERM_HEADER.size + 2 * (count + pos * stride)
+			answers = struct.unpack_from(f'<{len(question.answers)}H', permutation, answer_offset)
+
+			selected.append((question, answers))
+
+		return selected
+
+	def selected_uids(self, permutation: bytes) -> list[str]:
+		count, _ = _PERM_HEADER.unpack_from(permutation)
+		order = struct.unpack_from(f'<{count}H', permutation, _PERM_HEADER.size)
+
+		return [self.question_uids[idx] for idx in order]
+
+	@property
+	def page_count(self) -> int:
+		"""
+		The number of admin pages, at least one so that an empty quiz still has a page.
+		"""
+
+		if self.per_page <= 0:
+			return 1
+
+		return max(1, -(-len(self.questions) // self.per_page))
+
+	def admin_page(self, page: int = 0) -> bytes:
+		"""
+		Returns the encoded admin view of a page with every answer in uid order, encoding it once per snapshot.
+
+		Only pages below ``page_count`` are kept, so requests past the end cannot grow the snapshot.
+		"""
+
+		encoded = self._pages.get(page)
+		if encoded is None:
+			questions = b','.join(q.encode(order) for q, order in self.q_select(page))
+			encoded = self.encoded[:-1] + b',"questions":[' + questions + b']}'
+
+			if page < self.page_count:
+				self._pages[page] = encoded
+
+		return encoded
+
+	def dump(self) -> dict:
+		return {
+			'uid': self.uid,
+			'title': self.title,
+			'question_count': self.question_count,
+			'per_page': self.per_page,
+			'shuffle_questions': self.shuffle_questions,
+			'shuffle_answers': self.shuffle_answers
+		}
+
+def _compile_question(db_question: Question) -> CompiledQuestion:
+	answers = tuple(
+		CompiledAnswer(db_answer.uid, db_answer.text, db_answer.correct)
+		for db_answer
+		in sorted(db_question.answers, key=lambda a: a.uid)
+	)
+
+	return CompiledQuestion(db_question.uid, db_question.text, answers)
+
+class QuizCache():
+	"""
+	Process-wide LRU cache of compiled quizzes keyed by quiz uid.
+
+	Concurrent misses on the same quiz share one load, so a class opening a
+	quiz at once compiles it from a single query.
+	"""
+
+	def __init__(self, maxsize: int) -> None:
+		self.maxsize = maxsize
+		self.hits = 0
+		self.misses = 0
+		self._quizzes: OrderedDict[str, CompiledQuiz] = OrderedDict()
+		self.flight = SingleFlight()
+		self._epoch = 0
+
+	def __len__(self) -> int:
+		return len(self._quizzes)
+
+	async def get(self, db: DB, uid: str) -> CompiledQuiz | None:
+		"""
+		Returns the compiled quiz, loading and compiling it on a cache miss.
+
+		:param db: The DB used to load the quiz on a cache miss.
+		:param uid: The quiz uid.
+		:return: The compiled quiz, or None when the quiz does not exist.
+		"""
+
+		compiled = self._quizzes.get(uid)
+		if compiled is not None:
+			self.hits += 1
+			self._quizzes.move_to_end(uid)
+			return compiled
+
+		self.misses += 1
+
+		return await self.flight.do(uid, lambda: self._load(db, uid))
+
+	async def _load(self, db: DB, uid: str) -> CompiledQuiz | None:
+		epoch = self._epoch
+
+		db_quiz = await db.query_item(
+			Quiz,
+			joined=[[Quiz.questions, Question.answers]],
+			uid=uid
+		)
+
+		if not db_quiz:
+			return None
+
+		compiled = CompiledQuiz(db_quiz)
+
+		# a quiz invalidated while it was loading may have been read before the write
+		if epoch == self._epoch:
+			self.put(compiled)
+
+		return compiled
+
+	async def get_many(self, db: DB, uids: list[str]) -> dict[str, CompiledQuiz]:
+		"""
+		Returns the compiled quizzes of the given uids, loading every missing quiz with a single query.
+
+		:param db: The DB used to load missing quizzes.
+		:param uids: The quiz uids.
+		:return: A dict of the found quizzes keyed by uid. Unknown uids are omitted.
+		"""
+
+		found = {}
+		for uid in uids:
+			compiled = self._quizzes.get(uid)
+			if compiled is not None:
+				self._quizzes.move_to_end(uid)
+				found[uid] = compiled
+
+		missing = [uid for uid in uids if uid not in found]
+
+		self.hits += len(found)
+		self.misses += len(missing)
+
+		# quizzes already loading for other requests are awaited rather than queried again
+		waiting = {uid: future for uid in missing if (future := self.flight.pending(uid)) is not None}
+		leading = {uid: self.flight.begin(uid) for uid in missing if uid not in waiting}
+
+		if leading:
+			epoch = self._epoch
+			loaded = {}
+
+			try:
+				db_quizzes = await db.query_list(
+					Quiz,
+					joined=[[Quiz.questions, Question.answers]],
+					uid=list(leading)
+				)
+
+				for db_quiz in db_quizzes:
+					compiled = CompiledQuiz(db_quiz)
+					if epoch == self._epoch:
+						self.put(compiled)
+					loaded[compiled.uid] = compiled
+
+			except BaseException as e:
+				for uid, future in leading.items():
+					self.flight.end(uid, future, error=e)
+				raise
+
+			for uid, future in leading.items():
+				self.flight.end(uid, future, loaded.get(uid))
+
+			found.update(loaded)
+
+		for uid, future in waiting.items():
+			if await self.flight.wait(future):
+				compiled = future.result()
+			else:
+				compiled = await self.get(db, uid)
+
+			if compiled is not None:
+				found[uid] = compiled
+
+		return found
+
+	def put(self, compiled: CompiledQuiz) -> None:
+		self._quizzes[compiled.uid] = compiled
+		self._quizzes.move_to_end(compiled.uid)
+
+		while len(self._quizzes) > self.maxsize:
+			self._quizzes.popitem(last=False)
+
+	def invalidate(self, uid: str) -> None:
+		self._quizzes.pop(uid, None)
+		self.flight.forget(uid)
+		self._epoch += 1
+
+	def clear(self) -> None:
+		self._quizzes.clear()
+		self.flight.clear()
+		self._epoch += 1
+
+quiz_cache = QuizCache(cfg.QUIZ_CACHE_SIZE)
+
+def _quiz_changed(pk: list | None, _) -> None:
+	if pk is None:
+		quiz_cache.clear()
+	elif pk:
+		quiz_cache.invalidate(pk[0])
+
+bus.subscribe(Quiz.__name__, _quiz_changed)
+bus.on_reset(quiz_cache.clear)
@@ -1,8 +1,77 @@
-from sqlalchemy.ext.asyncio import create_async_engine
+import asyncio
+
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 
 from . import _config as cfg
+from ._pool import TelemetryPool, pool_stats
+
+_engine: AsyncEngine | None = None
+
+def create_engine() -> AsyncEngine:
+	return create_async_engine(
+		cfg.PG_URL,
+		poolclass=TelemetryPool,
+		pool_size=cfg.PG_POOL_SIZE,
+		max_overflow=cfg.PG_MAX_OVERFLOW,
+		pool_timeout=cfg.PG_POOL_TIMEOUT,
+		pool_recycle=cfg.PG_POOL_RECYCLE,
+		pool_pre_ping=cfg.PG_PRE_PING,
+		connect_args={'prepared_statement_cache_size': cfg.PG_STATEMENT_CACHE_SIZE}
+	)
+
+def get_engine() -> AsyncEngine:
+	"""
+	Returns the process-wide engine, creating it on first use.
+	"""
+
+	global _engine
+
+	if _engine is None:
+		_engine = create_engine()
+
+	return _engine
+
+def pool_status() -> dict:
+	"""
+	Returns the occupancy of the process-wide pool along with the checkout telemetry of every pool.
+	"""
+
+	pool = _engine.pool if _engine is not None else None
+
+	return {
+		'size': cfg.PG_POOL_SIZE,
+		'max_overflow': cfg.PG_MAX_OVERFLOW,
+		'checked_out': pool.checkedout() if isinstance(pool, TelemetryPool) else 0,
+		**pool_stats.snapshot()
+	}
+
+async def dispose_engine() -> None:
+	global _engine
+
+	if _engine is not None:
+		await _engine.dispose()
+		_engine = None
+
+async def warm_up(connections: int | None = None) -> None:
+	"""
+	Opens connections of the process-wide engine concurrently and returns them
+	to the pool, so the first requests do not pay for connecting.
+
+	:param connections: The number of connections to open. Defaults to PG_POOL_WARMUP.
+	"""
+
+	engine = get_engine()
+	connections = cfg.PG_POOL_WARMUP if connections is None else connections
+
+	conns = [engine.connect() for _ in range(connections)]
+	results = await asyncio.gather(*(conn.start() for conn in conns), return_exceptions=True)
 
-def create_engine():
-	return create_async_engine(cfg.PG_URL, pool_recycle=3600, pool_pre_ping=True)
+	await asyncio.gather(*(
+		conn.close()
+		for conn, result in zip(conns, results)
+		if not isinstance(result, BaseException)
+	))
 
-default_engine = create_engine()
+	for result in results:
+		if isinstance(result, BaseException):
+			raise result
@@ -0,0 +1,101 @@
+from typing import Awaitable, Callable, Hashable, TypeVar
+import asyncio
+
+T = TypeVar('T')
+
+class SingleFlight():
+	"""
+	Coalesces concurrent loads of the same key into one in-flight call.
+
+	The first caller of a key leads and runs the load; callers arriving while
+	it runs await its result or exception instead of loading again. A leader
+	that is cancelled, e.g. by a client disconnecting, does not fail its
+	followers: they retry and one of them leads the next load.
+	"""
+
+	def __init__(self) -> None:
+		self.loads = 0
+		self.coalesced = 0
+		self._calls: dict[Hashable, asyncio.Future] = {}
+
+	def __len__(self) -> int:
+		return len(self._calls)
+
+	def pending(self, key: Hashable) -> asyncio.Future | None:
+		return self._calls.get(key)
+
+	def begin(self, key: Hashable) -> asyncio.Future:
+		"""
+		Registers the caller as the leader of a key. The leader must settle the returned future with ``end``.
+		"""
+
+		future = asyncio.get_running_loop().create_future()
+		self._calls[key] = future
+		self.loads += 1
+
+		return future
+
+	def end(self, key: Hashable, future: asyncio.Future, result=None, error: BaseException | None = None) -> None:
+		if self._calls.get(key) is future:
+			del self._calls[key]
+
+		if future.done():
+			return
+
+		if isinstance(error, asyncio.CancelledError):
+			future.cancel()
+		elif error is not None:
+			future.set_exception(error)
+			# followers re-raise it; without any, the exception must not be reported as never retrieved
+			future.exception()
+		else:
+			future.set_result(result)
+
+	def forget(self, key: Hashable) -> None:
+		"""
+		Detaches the in-flight load of a key, so later callers start a fresh one. Callers already waiting still get its result.
+		"""
+
+		self._calls.pop(key, None)
+
+	def clear(self) -> None:
+		self._calls.clear()
+
+	async def wait(self, future: asyncio.Future) -> bool:
+		"""
+		Waits for a leader to settle its future.
+
+		:return: Whether it completed, False when the leader was cancelled and the caller should retry.
+		"""
+
+		self.coalesced += 1
+
+		# unlike awaiting the future directly, cancelling the caller leaves the leader's future alone
+		await asyncio.wait([future])
+
+		return not future.cancelled()
+
+	async def do(self, key: Hashable, load: Callable[[], Awaitable[T]]) -> T:
+		"""
+		Runs a load once for every concurrent caller of the same key.
+
+		:param key: The load key.
+		:param load: Called by the leader to produce the shared result.
+		:return: The result of the load.
+		"""
+
+		while (future := self._calls.get(key)) is not None:
+			if await self.wait(future):
+				return future.result()
+
+		future = self.begin(key)
+
+		try:
+			result = await load()
+		except BaseException as e:
+			self.end(key, future, error=e)
+			raise
+
+		self.end(key, future, result)
+
+		return result
@@ -0,0 +1,66 @@
+from sqlalchemy import func, update
+from sqlalchemy.sql import select
+
+from ._models import Question, Answer, Assignment, Submission
+from ._session import DB
+
+async def tally(db: DB, user_uid: str, question_uids: list[str]) -> tuple[int, int]:
+	"""
+	Counts the answered and correctly answered questions of a user in one aggregate query.
+
+	:param db: The DB to query.
+	:param user_uid: The user uid.
+	:param question_uids: The uids of the questions to count.
+	:return: A tuple of (answered, correct).
+	"""
+
+	stmt = (
+		select(func.count(), func.count().filter(Answer.correct))
+		.select_from(Submission)
+		.join(Answer, Answer.uid == Submission.answer_uid)
+		.where(Submission.user_uid == user_uid, Submission.question_uid.in_(question_uids))
+	)
+
+	result = await db.session.execute(stmt)
+	answered, correct = result.one()
+
+	return answered, correct
+
+async def grade_pending(db: DB, quiz_uid: str) -> list[tuple[str, float]]:
+	"""
+	Grades every ungraded assignment of a quiz with a single correlated UPDATE.
+
+	Unanswered questions count as incorrect.
+
+	:param db: The DB to write with.
+	:param quiz_uid: The quiz uid.
+	:return: The (user uid, score) of each graded assignment.
+	"""
+
+	correct = (
+		select(func.count())
+		.select_from(Submission)
+		.join(Answer, Answer.uid == Submission.answer_uid)
+		.join(Question, Question.uid == Answer.question_uid)
+		.where(
+			Submission.user_uid == Assignment.user_uid,
+			Question.quiz_uid == Assignment.quiz_uid,
+			Answer.correct
+		)
+		.scalar_subquery()
+	)
+
+	stmt = (
+		update(Assignment)
+		.where(Assignment.quiz_uid == quiz_uid, Assignment.completed.is_(False))
+		.values(completed=True, score=correct, version=Assignment.version + 1)
+		.returning(Assignment.user_uid, Assignment.score)
+		.execution_options(synchronize_session=False)
+	)
+
+	result = await db.session.execute(stmt)
+	graded = [(user_uid, score) for user_uid, score in result.all()]
+
+	db.invalidate(Assignment)
+
+	return graded
@@ -0,0 +1,139 @@
+from typing import Awaitable, Callable
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from ._engine import create_engine
+
+MIGRATION = Callable[[AsyncConnection], Awaitable[None]]
+
+logger = logging.getLogger(__name__)
+
+# arbitrary key of the advisory lock serializing concurrent migrators
+_LOCK_KEY = 0x71756978
+
+# the schema as first released, frozen so that later model changes only ever land in new migrations
+_BASELINE = (
+	'CREATE TABLE IF NOT EXISTS "user" ('
+	'uid CHAR(13) NOT NULL, '
+	'username VARCHAR(64) NOT NULL, '
+	'hashed_pw VARCHAR(72) NOT NULL, '
+	'is_admin BOOLEAN NOT NULL, '
+	'PRIMARY KEY (uid))',
+	'CREATE INDEX IF NOT EXISTS ix_user_username ON "user" (username)',
+
+	'CREATE TABLE IF NOT EXISTS quiz ('
+	'uid CHAR(13) NOT NULL, '
+	'title VARCHAR(256) NOT NULL, '
+	'question_count INTEGER NOT NULL, '
+	'per_page INTEGER NOT NULL, '
+	'shuffle_questions BOOLEAN NOT NULL, '
+	'shuffle_answers BOOLEAN NOT NULL, '
+	'PRIMARY KEY (uid))',
+	'CREATE INDEX IF NOT EXISTS ix_quiz_title ON quiz (title)',
+
+	'CREATE TABLE IF NOT EXISTS question ('
+	'uid CHAR(13) NOT NULL, '
+	'quiz_uid CHAR(13) NOT NULL, '
+	'text VARCHAR(512) NOT NULL, '
+	'PRIMARY KEY (uid), '
+	'FOREIGN KEY(quiz_uid) REFERENCES quiz (uid))',
+	'CREATE INDEX IF NOT EXISTS ix_question_quiz_uid ON question (quiz_uid)',
+
+	'CREATE TABLE IF NOT EXISTS answer ('
+	'uid CHAR(13) NOT NULL, '
+	'question_uid CHAR(13) NOT NULL, '
+	'text VARCHAR(256) NOT NULL, '
+	'correct BOOLEAN NOT NULL, '
+	'PRIMARY KEY (uid), '
+	'FOREIGN KEY(question_uid) REFERENCES question (uid))',
+	'CREATE INDEX IF NOT EXISTS ix_answer_question_uid ON answer (question_uid)',
+
+	'CREATE TABLE IF NOT EXISTS assignment ('
+	'user_uid CHAR(13) NOT NULL, '
+	'quiz_uid CHAR(13) NOT NULL, '
+	'rng_seed INTEGER NOT NULL, '
+	'completed BOOLEAN NOT NULL, '
+	'score REAL NOT NULL, '
+	'PRIMARY KEY (user_uid, quiz_uid), '
+	'FOREIGN KEY(user_uid) REFERENCES "user" (uid), '
+	'FOREIGN KEY(quiz_uid) REFERENCES quiz (uid))',
+
+	'CREATE TABLE IF NOT EXISTS submission ('
+	'user_uid CHAR(13) NOT NULL, '
+	'question_uid CHAR(13) NOT NULL, '
+	'answer_uid CHAR(13) NOT NULL, '
+	'PRIMARY KEY (user_uid, question_uid), '
+	'FOREIGN KEY(user_uid) REFERENCES "user" (uid), '
+	'FOREIGN KEY(question_uid) REFERENCES question (uid), '
+	'FOREIGN KEY(answer_uid) REFERENCES answer (uid))',
+	'CREATE INDEX IF NOT EXISTS ix_submission_answer_uid ON submission (answer_uid)',
+)
+
+async def _create_tables(conn: AsyncConnection) -> None:
+	# IF NOT EXISTS: databases from before versioned migrations already have these tables
+	for stmt in _BASELINE:
+		await conn.execute(text(stmt))
+
+async def _add_versions(conn: AsyncConnection) -> None:
+	# tables created before token versions and stored permutations existed
+	for stmt in (
+		'ALTER TABLE "user" ADD COLUMN IF NOT EXISTS token_version INTEGER NOT NULL DEFAULT 0',
+		'ALTER TABLE assignment ADD COLUMN IF NOT EXISTS permutation BYTEA',
+		'ALTER TABLE assignment ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 0'
+	):
+		await conn.execute(text(stmt))
+
+MIGRATIONS: list[tuple[int, str, MIGRATION]] = [
+	(1, 'create tables', _create_tables),
+	(2, 'add token, assignment and permutation versions', _add_versions),
+]
+
+async def migrate(engine: AsyncEngine | None = None) -> list[int]:
+	"""
+	Applies pending schema migrations in order within a single transaction.
+
+	Applied versions are recorded in the schema_version table, and concurrent
+	callers are serialized with an advisory lock, so it is safe to run from
+	several processes at once.
+
+	:param engine: The engine to migrate with. A temporary engine is created and disposed when omitted.
+	:return: The applied versions.
+	"""
+
+	own_engine = engine is None
+	engine = create_engine() if engine is None else engine
+
+	applied = []
+
+	try:
+		async with engine.begin() as conn:
+			await conn.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': _LOCK_KEY})
+			await conn.execute(text(
+				'CREATE TABLE IF NOT EXISTS schema_version ('
+				'version INTEGER PRIMARY KEY, '
+				'name VARCHAR(128) NOT NULL, '
+				'applied_at TIMESTAMPTZ NOT NULL DEFAULT now())'
+			))
+
+			current = (await conn.execute(text('SELECT coalesce(max(version), 0) FROM schema_version'))).scalar_one()
+
+			for version, name, step in MIGRATIONS:
+				if version <= current:
+					continue
+
+				await step(conn)
+				await conn.execute(
+					text('INSERT INTO schema_version (version, name) VALUES (:version, :name)'),
+					{'version': version, 'name': name}
+				)
+
+				logger.info('Applied migration %d: %s', version, name)
+				applied.append(version)
+
+	finally:
+		if own_engine:
+			await engine.dispose()
+
+	return applied
@@ -1,35 +1,14 @@
 from __future__ import annotations
-import asyncio, random
+import random
 
-from sqlalchemy import BOOLEAN, INTEGER, REAL, CHAR, VARCHAR, ForeignKey
+from sqlalchemy import BOOLEAN, INTEGER, REAL, CHAR, VARCHAR, LargeBinary, ForeignKey
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from tsidpy import TSID, TSIDGenerator
 
-from ._engine import create_engine
-
-def generate_uid() -> str:
-	return TSIDGenerator().create().to_string()
-
-def increment_uid(uid: str, num: int = 1) -> str:
-	tsid = TSID.from_string(uid)
-	return TSID(tsid.number + num).to_string()
+from ._uid import generate_uid
 
 def rng_seed() -> int:
 	return random.randint(0, 2**31 - 1)
 
-class UIDGenerator:
-	def __init__(self, ordered: bool = False) -> None:
-		self.uid = generate_uid()
-		self.ordered = ordered
-
-	def create(self) -> str:
-		if self.ordered:
-			self.uid = increment_uid(self.uid)
-		else:
-			self.uid = generate_uid()
-
-		return self.uid
-
 class Base(DeclarativeBase):
 	pass
 
@@ -43,6 +22,7 @@ class User(Base):
 	username: Mapped[str] = mapped_column(VARCHAR(64), index=True)
 	hashed_pw: Mapped[str] = mapped_column(VARCHAR(72))
 	is_admin: Mapped[bool] = mapped_column(BOOLEAN, default=False)
+	token_version: Mapped[int] = mapped_column(INTEGER, default=0, info={'version': True})
 
 	# 1-to-N
 	assignments: Mapped[list[Assignment]] = relationship(
@@ -75,38 +55,6 @@ class Quiz(Base):
 		lazy='selectin'
 	)
 
-	def q_select(
-		self,
-		page: int = 0,
-		seed: int | None = None,
-		admin: bool = False
-	) -> list[Question]:
-		question_count = self.question_count if not admin else len(self.questions)
-
-		if question_count > len(self.questions):
-			raise ValueError('Question count exceeds available questions')
-
-		if seed is None:
-			seed = rng_seed()
-
-		rng = random.Random(seed)
-
-		if admin:
-			questions = sorted(self.questions, key=lambda q: q.uid)
-		elif self.shuffle_questions:
-			questions = rng.sample(self.questions, question_count)
-		else:
-			questions = rng.sample(self.questions, question_count)
-			questions = sorted(questions, key=lambda q: q.uid)
-
-		idx_l, idx_r = self.per_page * page, self.per_page * (page + 1)
-
-		questions = questions[idx_l:idx_r]
-		for q in questions:
-			q.shuffle_ans(seed, admin)
-
-		return questions
-
 	def dump(self) -> dict:
 		return {
 			'uid': self.uid,
@@ -143,29 +91,6 @@ class Question(Base):
 		lazy='selectin'
 	)
 
-	def shuffle_ans(
-		self,
-		seed: int | None = None,
-		admin: bool = False
-	) -> None:
-
-		if admin or not self.quiz.shuffle_answers:
-			self.answers = sorted(self.answers, key=lambda a: a.uid)
-		else:
-			if seed is None:
-				seed = rng_seed()
-
-			rng = random.Random(seed)
-			rng.shuffle(self.answers)
-
-	def dump(self) -> dict:
-		answers = sorted(self.answers, key=lambda a: a.uid)
-
-		return {
-			'text': self.text,
-			'answers': [answer.dump() for answer in answers]
-		}
-
 class Answer(Base):
 	__tablename__ = 'answer'
 
@@ -192,12 +117,6 @@ class Answer(Base):
 		lazy='selectin'
 	)
 
-	def dump(self) -> dict:
-		return {
-			'text': self.text,
-			'correct': self.correct
-		}
-
 class Assignment(Base):
 	__tablename__ = 'assignment'
 
@@ -207,8 +126,10 @@ class Assignment(Base):
 
 	# attributes
 	rng_seed: Mapped[int] = mapped_column(INTEGER, default=rng_seed)
+	permutation: Mapped[bytes | None] = mapped_column(LargeBinary, nullable=True, default=None)
 	completed: Mapped[bool] = mapped_column(BOOLEAN, default=False)
 	score: Mapped[float] = mapped_column(REAL, default=-1.0)
+	version: Mapped[int] = mapped_column(INTEGER, default=0, info={'version': True})
 
 	# N-to-1
 	user: Mapped[User] = relationship(
@@ -218,7 +139,7 @@ class Assignment(Base):
 	quiz: Mapped[Quiz] = relationship(
 		'Quiz',
 		back_populates='assignments',
-		lazy='selectin'
+		lazy='raise'
 	)
 
 class Submission(Base):
@@ -235,20 +156,5 @@ class Submission(Base):
 	answer: Mapped[Answer] = relationship(
 		'Answer',
 		back_populates='submissions',
-		lazy='selectin'
+		lazy='raise'
 	)
-
-async def create_tables() -> None:
-	async with create_engine().begin() as connection:
-		await connection.run_sync(Base.metadata.create_all)
-
-try:
-	loop = asyncio.get_running_loop()
-except RuntimeError:
-	loop = asyncio.new_event_loop()
-	asyncio.set_event_loop(loop)
-
-if loop.is_running():
-	loop.create_task(create_tables())
-else:
-	loop.run_until_complete(create_tables())
@@ -0,0 +1,53 @@
+from bisect import bisect_left
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry
+
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class PoolStats():
+	"""
+	Process-wide checkout telemetry shared by every engine's pool.
+
+	Wait times are counted into fixed buckets, with one extra bucket for waits
+	longer than the last bound.
+	"""
+
+	def __init__(self, buckets: tuple[float, ...] = WAIT_BUCKETS) -> None:
+		self.buckets = buckets
+		self.counts = [0] * (len(buckets) + 1)
+		self.wait_sum = 0.0
+		self.checkouts = 0
+		self.timeouts = 0
+
+	def observe(self, wait: float) -> None:
+		self.counts[bisect_left(self.buckets, wait)] += 1
+		self.wait_sum += wait
+		self.checkouts += 1
+
+	def snapshot(self) -> dict:
+		return {
+			'checkouts': self.checkouts,
+			'timeouts': self.timeouts,
+			'wait_sum': self.wait_sum,
+			'wait_buckets': dict(zip((*self.buckets, float('inf')), self.counts))
+		}
+
+pool_stats = PoolStats()
+
+class TelemetryPool(AsyncAdaptedQueuePool):
+	"""
+	Queue pool that records how long each checkout waited and how many timed out.
+	"""
+
+	def _do_get(self) -> ConnectionPoolEntry:
+		start = time.perf_counter()
+
+		try:
+			return super()._do_get()
+		except exc.TimeoutError:
+			pool_stats.timeouts += 1
+			raise
+		finally:
+			pool_stats.observe(time.perf_counter() - start)
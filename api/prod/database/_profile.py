@@ -0,0 +1,148 @@
+from types import FrameType
+import json, logging, os, sys
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+_APP_DIR = os.path.dirname(_PACKAGE_DIR)
+
+PROFILE_HEADER = 'X-Query-Profile'
+
+class Statement():
+	__slots__ = ('sql', 'elapsed', 'location')
+
+	def __init__(self, sql: str, elapsed: float | None, location: str) -> None:
+		self.sql = sql
+		self.elapsed = elapsed
+		self.location = location
+
+class Profile():
+	"""
+	Statements issued by one unit of work, with their timing and the code that issued them.
+
+	Statements are recorded with bind placeholders rather than values, so a
+	statement repeated with different parameters, the signature of an N+1
+	pattern, shows up as the same SQL.
+	"""
+
+	def __init__(self, label: str = '') -> None:
+		self.label = label
+		self.statements: list[Statement] = []
+
+	def __len__(self) -> int:
+		return len(self.statements)
+
+	def record(self, sql: str, location: str = '?') -> Statement:
+		"""
+		Records a statement along with the location of the application code that issued it.
+
+		:param sql: The SQL with bind placeholders.
+		:param location: The application code that issued the statement.
+		:return: The recorded statement. Its elapsed time is set once it has executed, and stays None for relationship loads timed as part of the statement that triggered them.
+		"""
+
+		stmt = Statement(sql, None, location)
+		self.statements.append(stmt)
+
+		return stmt
+
+	@property
+	def elapsed(self) -> float:
+		return sum(s.elapsed for s in self.statements if s.elapsed is not None)
+
+	def repeated(self) -> dict[str, list[Statement]]:
+		"""
+		Groups the statements issued more than once.
+		"""
+
+		groups: dict[str, list[Statement]] = {}
+		for stmt in self.statements:
+			groups.setdefault(stmt.sql, []).append(stmt)
+
+		return {sql: stmts for sql, stmts in groups.items() if len(stmts) > 1}
+
+	def summary(self) -> str:
+		return f'statements={len(self.statements)}; repeated={len(self.repeated())}; elapsed_ms={self.elapsed * 1000:.2f}'
+
+	def report(self) -> dict:
+		return {
+			'label': self.label,
+			'statements': len(self.statements),
+			'elapsed_ms': round(self.elapsed * 1000, 3),
+			'repeated': [
+				{
+					'sql': sql,
+					'count': len(stmts),
+					'locations': sorted({s.location for s in stmts})
+				}
+				for sql, stmts in self.repeated().items()
+			],
+			'trace': [
+				{
+					'sql': s.sql,
+					'elapsed_ms': None if s.elapsed is None else round(s.elapsed * 1000, 3),
+					'location': s.location
+				}
+				for s in self.statements
+			]
+		}
+
+	def log(self) -> None:
+		level = logging.WARNING if self.repeated() else logging.INFO
+		logger.log(level, 'Query profile %s', json.dumps(self.report(), separators=(',', ':')))
+
+def _caller(frame: FrameType | None) -> str:
+	fallback = '?'
+	while frame is not None:
+		filename = frame.f_code.co_filename
+
+		if filename.startswith(_APP_DIR) and not filename.startswith(_PACKAGE_DIR):
+			return f'{os.path.relpath(filename, _APP_DIR)}:{frame.f_lineno} ({frame.f_code.co_name})'
+
+		if fallback == '?' and filename.startswith(_PACKAGE_DIR):
+			fallback = f'{os.path.relpath(filename, _APP_DIR)}:{frame.f_lineno} ({frame.f_code.co_name})'
+
+		frame = frame.f_back
+
+	return fallback
+
+class ProfiledSession(AsyncSession):
+	"""
+	Async session remembering the application code that awaits each statement.
+
+	Statements run on a greenlet spawned by the session, away from the frames
+	of the awaiting code, so the location is taken when execute is called.
+	"""
+
+	location = '?'
+
+	async def execute(self, *args, **kwargs):
+		self.location = _caller(sys._getframe(1))
+		return await super().execute(*args, **kwargs)
+
+class ProfileMiddleware():
+	"""
+	ASGI middleware exposing the profile summary of a profiled request in a response header.
+	"""
+
+	def __init__(self, app) -> None:
+		self.app = app
+
+	async def __call__(self, scope, receive, send) -> None:
+		if scope['type'] != 'http':
+			await self.app(scope, receive, send)
+			return
+
+		async def send_profile(message) -> None:
+			if message['type'] == 'http.response.start':
+				profile = scope.get('state', {}).get('query_profile')
+				if profile is not None:
+					message['headers'] = [
+						*message.get('headers', []),
+						(PROFILE_HEADER.lower().encode(), profile.summary().encode())
+					]
+			await send(message)
+
+		await self.app(scope, receive, send_profile)
@@ -1,15 +1,44 @@
-from datetime import datetime, timezone, timedelta
-from hashlib import sha256
-from typing import TypeVar, cast, Any
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from typing import Any, Callable, Generic, Literal, TypeVar, cast
+import binascii, json, logging, random, time
 
+from fastapi import Request
+from sqlalchemy import Row, event, func, inspect, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import DeclarativeBase, InstrumentedAttribute, selectinload
-from sqlalchemy.sql import select
+from sqlalchemy.orm import DeclarativeBase, InstrumentedAttribute, ORMExecuteState, Session, defaultload, noload, raiseload, selectinload
+from sqlalchemy.sql import ClauseElement, select, insert
 
-from ._engine import create_engine, default_engine
+import metrics
+
+from . import _config as cfg
+from ._bus import EVENT, bus
+from ._cache import QueryCache
+from ._engine import create_engine, get_engine
+from ._models import Base
+from ._profile import PROFILE_HEADER, Profile, ProfiledSession
 
 MODEL = TypeVar('MODEL', bound=DeclarativeBase)
 INST_ATTR = InstrumentedAttribute | list[InstrumentedAttribute]
+LAZY = Literal['raise', 'noload', 'default']
+
+logger = logging.getLogger(__name__)
+
+_STATEMENTS = metrics.Histogram(
+	'quiz_db_statements_per_request',
+	'Statements issued per unit of work, excluding flushes',
+	buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 50)
+)
+_SECONDS = metrics.Histogram(
+	'quiz_db_seconds_per_request',
+	'Time spent executing statements and committing per unit of work'
+)
+_QUERIES = metrics.Counter('quiz_db_queries_total', 'Queries by DB method, including cache hits', ['method'])
+_QUERY_ITEM = _QUERIES.labels('query_item')
+_QUERY_LIST = _QUERIES.labels('query_list')
+
+class QueryBudgetExceeded(RuntimeError):
+	pass
 
 def _chain_opt(chain: INST_ATTR):
 	if isinstance(chain, list):
@@ -21,8 +50,34 @@ def _chain_opt(chain: INST_ATTR):
 
 	return opt
 
-def _build_stmt(model: type[MODEL], joined: list[INST_ATTR] | None = None, **kwargs):
-	stmt = select(model)
+def _lazy_opts(joined: list[INST_ATTR], lazy: LAZY) -> list:
+	if lazy == 'default':
+		return []
+
+	opts = [raiseload('*') if lazy == 'raise' else noload('*')]
+	for chain in joined:
+		chain = chain if isinstance(chain, list) else [chain]
+
+		for depth in range(1, len(chain) + 1):
+			opt = defaultload(chain[0])
+			for attr in chain[1:depth]:
+				opt = opt.defaultload(attr)
+
+			opts.append(opt.raiseload('*') if lazy == 'raise' else opt.noload('*'))
+
+	return opts
+
+def _build_stmt(
+	model: type[MODEL],
+	joined: list[INST_ATTR] | None = None,
+	columns: list[InstrumentedAttribute] | None = None,
+	lazy: LAZY = 'raise',
+	**kwargs
+):
+	if columns:
+		stmt = select(*columns)
+	else:
+		stmt = select(model)
 
 	for k, v in kwargs.items():
 		attr = getattr(model, k)
@@ -34,86 +89,209 @@ def _build_stmt(model: type[MODEL], joined: list[INST_ATTR] | None = None, **kwa
 		else:
 			stmt = stmt.where(attr == v)
 
-	for chain in joined or []:
-		opt = _chain_opt(chain)
-		stmt = stmt.options(opt)
+	if not columns:
+		for chain in joined or []:
+			opt = _chain_opt(chain)
+			stmt = stmt.options(opt)
+
+		stmt = stmt.options(*_lazy_opts(joined or [], lazy))
 
 	return stmt
 
-class Cache():
-	def __init__(self, data, TTL: timedelta):
-		self.data = data
-		self.created = datetime.now(timezone.utc)
-		self.TTL = TTL
+def _pk_columns(model: type[DeclarativeBase]) -> list:
+	return list(inspect(model).primary_key)
 
-	def expired(self) -> bool:
-		return datetime.now(timezone.utc) > self.created + self.TTL
+def _version(obj: DeclarativeBase) -> int | None:
+	for attr in inspect(obj).mapper.column_attrs:
+		if attr.columns[0].info.get('version'):
+			return getattr(obj, attr.key)
 
-	async def merged(self, session: AsyncSession) -> Any:
-		if isinstance(self.data, list):
-			return [await session.merge(item) for item in self.data]
-		else:
-			return await session.merge(self.data)
+	return None
+
+def encode_cursor(item: DeclarativeBase, model: type[DeclarativeBase] | None = None) -> str:
+	"""
+	Encodes the primary key of an item, or of a Row of projected columns of ``model`` that include it.
+	"""
+
+	if model is None:
+		values = inspect(item).mapper.primary_key_from_instance(item)
+	else:
+		values = [getattr(item, column.key) for column in _pk_columns(model)]
+
+	return urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode().rstrip('=')
+
+def decode_cursor(model: type[DeclarativeBase], cursor: str) -> list:
+	try:
+		values = json.loads(urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+	except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError):
+		raise ValueError('Invalid cursor')
+
+	pk = _pk_columns(model)
+	if not isinstance(values, list) or len(values) != len(pk):
+		raise ValueError('Invalid cursor')
+
+	# exact types, so that e.g. a bool never stands in for an int
+	if any(type(value) is not column.type.python_type for value, column in zip(values, pk)):
+		raise ValueError('Invalid cursor')
+
+	return values
+
+class Page(Generic[MODEL]):
+	__slots__ = ('items', 'cursor', 'total')
+
+	def __init__(self, items: list[MODEL], cursor: str | None, total: int | None = None) -> None:
+		self.items = items
+		self.cursor = cursor
+		self.total = total
 
 class DB():
-	config: dict = {
-		'TTL': timedelta(minutes=15)
-	}
-	item_cache: dict[str, Cache] = {}
-	list_cache: dict[str, Cache] = {}
+	cache = QueryCache(cfg.QUERY_CACHE_SIZE, cfg.QUERY_CACHE_TTL)
 
-	def __init__(self, new_engine: bool = False):
+	def __init__(self, new_engine: bool = False, profile: Profile | None = None):
 		self._dispose_after_use = new_engine
-		self.engine = create_engine() if new_engine else default_engine
+		self.engine = create_engine() if new_engine else get_engine()
+		self.profile = profile
+
+		self.statements = 0
+		self.elapsed = 0.0
+		self.budget: int | None = None
+		self._depth = 0
+		self._events: list[EVENT] = []
+		self._written: list[tuple[type[DeclarativeBase], tuple | None]] = []
+		self._on_commit: list[Callable[[], None]] = []
 
 	async def __aenter__(self):
-		self.session = AsyncSession(self.engine, autoflush=False, expire_on_commit=False)
+		session_cls = AsyncSession if self.profile is None else ProfiledSession
+		self.session = session_cls(self.engine, autoflush=False, expire_on_commit=False)
+		event.listen(self.session.sync_session, 'after_flush', self._after_flush)
+		event.listen(self.session.sync_session, 'do_orm_execute', self._execute)
 
 		return self
 
 	async def __aexit__(self, exc_type, exc_val, exc_tb):
+		if not exc_type and self.budget is not None and self.statements > self.budget:
+			message = f'{self.statements} statements issued, {self.budget} expected'
+			if self.profile is not None:
+				message += ''.join(
+					f'; {len(stmts)}x from {", ".join(sorted({s.location for s in stmts}))}'
+					for stmts in self.profile.repeated().values()
+				)
+
+			if cfg.QUERY_BUDGET == 'raise':
+				exc_type = QueryBudgetExceeded
+				exc_val = QueryBudgetExceeded(message)
+			elif cfg.QUERY_BUDGET == 'warn':
+				logger.warning('Query budget exceeded: %s', message)
+
+		start = time.perf_counter()
+
 		if exc_type:
 			await self.session.rollback()
 		else:
+			# the final flush records the events of pending changes before they are published
+			await self.session.flush()
+			await bus.publish(self.session, self._events)
 			await self.session.commit()
 
+			# other requests may have cached the old rows between the flush and the commit
+			for model, pk in self._written:
+				self.cache.invalidate(model, pk)
+
+			for callback in self._on_commit:
+				callback()
+
+		self.elapsed += time.perf_counter() - start
+
 		await self.session.close()
 
+		_STATEMENTS.observe(self.statements)
+		_SECONDS.observe(self.elapsed)
+
+		if self.profile is not None:
+			self.profile.log()
+
 		if self._dispose_after_use:
 			await self.engine.dispose()
 
+		if isinstance(exc_val, QueryBudgetExceeded):
+			raise exc_val
+
+	def expect(self, statements: int) -> None:
+		"""
+		Declares the maximum number of statements the current unit of work may issue.
+
+		Every ORM execution counts, including relationship loads; flushes do not.
+		Exceeding the budget is logged or raised depending on QUERY_BUDGET.
+
+		:param statements: The statement budget.
+		"""
+
+		self.budget = statements
+
+	def on_commit(self, callback: Callable[[], None]) -> None:
+		"""
+		Calls a function once the unit of work has committed, e.g. to evict state derived from the written rows.
+		"""
+
+		self._on_commit.append(callback)
+
 	async def query_item(
 		self,
 		model: type[MODEL],
 		joined: list[INST_ATTR] | None = None,
+		lazy: LAZY = 'raise',
 		cache: bool = False,
+		lock: bool = False,
 		**kwargs
 	) -> MODEL | None:
-		""""
+		"""
 		Queries a single item from the database.
 
 		:param model: The model to query. Must be a subclass of DeclarativeBase.
 		:param joined: A list of InstrumentedAttribute objects to join. Use list for nested joins.
+		:param lazy: How relationships outside of joined behave: 'raise' on access, 'noload' as empty, or the mapper 'default'.
+		:param cache: Whether to serve the item from the query cache. Only column attributes are cached.
+		:param lock: Whether to lock the row until the unit of work ends (SELECT ... FOR UPDATE). Locked reads are never cached.
 		:param kwargs: The query parameters. When the value is a list, the query will use the IN operator.
 		:return: The queried item.
 		"""
 
-		stmt = _build_stmt(model, joined, **kwargs)
+		_QUERY_ITEM.inc()
 
-		stmt_hash = sha256(str(stmt).encode()).hexdigest()
-		if cache and stmt_hash in self.item_cache:
-			if not self.item_cache[stmt_hash].expired():
-				return await self.item_cache[stmt_hash].merged(self.session)
-			else:
-				del self.item_cache[stmt_hash]
+		stmt = _build_stmt(model, joined, None, lazy, **kwargs)
+		cache = cache and not lock
+
+		if lock:
+			stmt = stmt.with_for_update()
+
+		if cache:
+			items = await self._query_cached(model, stmt, is_list=False)
+			return items[0] if items else None
 
 		result = await self.session.execute(stmt)
-		result = result.scalars().first()
+		return result.scalars().first()
 
-		if cache and result:
-			self.item_cache[stmt_hash] = Cache(result, self.config['TTL'])
+	async def query_row(
+		self,
+		model: type[DeclarativeBase],
+		columns: list[InstrumentedAttribute],
+		**kwargs
+	) -> Row[Any] | None:
+		"""
+		Queries some columns of a single item from the database, e.g. to check that it exists without loading it.
+
+		:param model: The model to query. Must be a subclass of DeclarativeBase.
+		:param columns: The columns to project.
+		:param kwargs: The query parameters. When the value is a list, the query will use the IN operator.
+		:return: A Row of the columns, or None when no item matches.
+		"""
+
+		_QUERY_ITEM.inc()
 
-		return result
+		stmt = _build_stmt(model, None, columns, 'raise', **kwargs)
+
+		result = await self.session.execute(stmt)
+		return result.first()
 
 	async def query_list(
 		self,
@@ -121,6 +299,9 @@ class DB():
 		joined: list[INST_ATTR] | None = None,
 		offset: int = 0,
 		limit: int = -1,
+		cursor: str | None = None,
+		columns: list[InstrumentedAttribute] | None = None,
+		lazy: LAZY = 'raise',
 		cache: bool = False,
 		**kwargs
 	) -> list[MODEL]:
@@ -131,30 +312,265 @@ class DB():
 		:param joined: A list of InstrumentedAttribute objects to join. Use list for nested joins.
 		:param offset: The offset to start the query from.
 		:param limit: The maximum number of items to return. -1 for no limit.
+		:param cursor: A cursor from encode_cursor. Only items after it in primary key order are returned.
+		:param columns: Columns to project. When given, Rows of these columns are returned instead of model instances.
+		:param lazy: How relationships outside of joined behave: 'raise' on access, 'noload' as empty, or the mapper 'default'.
+		:param cache: Whether to serve the items from the query cache. Only column attributes are cached.
 		:param kwargs: The query parameters. When the value is a list, the query will use the IN operator.
 		:return: The queried list of items.
 		"""
 
-		stmt = _build_stmt(model, joined, **kwargs)
+		_QUERY_LIST.inc()
+
+		stmt = _build_stmt(model, joined, columns, lazy, **kwargs)
+		cache = cache and not columns
+
+		if cursor is not None:
+			pk = _pk_columns(model)
+			stmt = stmt.where(tuple_(*pk) > tuple_(*decode_cursor(model, cursor)))
+
+		if limit > 0 or cursor is not None:
+			stmt = stmt.order_by(*_pk_columns(model))
 
 		if limit > 0:
 			stmt = stmt.limit(limit).offset(offset)
 
-		stmt_hash = sha256(str(stmt).encode()).hexdigest()
-		if cache and stmt_hash in self.list_cache:
-			if not self.list_cache[stmt_hash].expired():
-				return await self.list_cache[stmt_hash].merged(self.session)
-			else:
-				del self.list_cache[stmt_hash]
+		if cache:
+			return await self._query_cached(model, stmt, is_list=True)
 
 		result = await self.session.execute(stmt)
-		result = result.scalars().all()
-
-		if cache and result:
-			self.list_cache[stmt_hash] = Cache(result, self.config['TTL'])
+		result = result.all() if columns else result.scalars().all()
 
 		return cast(list[MODEL], result)
 
-async def provide_db():
-	async with DB() as db:
+	async def _query_cached(self, model: type[MODEL], stmt, is_list: bool) -> list[MODEL]:
+		"""
+		Serves a query from the query cache, running it on a miss.
+
+		Concurrent misses on the same statement, from any session, run it once:
+		the others wait for it and merge the rows it cached into their own session.
+		"""
+
+		stmt_key = self.cache.key(stmt)
+		flight = self.cache.flight
+
+		while True:
+			cached = self.cache.get(stmt_key)
+			if cached is not None:
+				return cast(list[MODEL], [await self.session.merge(item, load=False) for item in cached])
+
+			future = flight.pending(stmt_key)
+			if future is None:
+				break
+
+			# empty results are not cached, and a cached result may be invalidated before it is read
+			if await flight.wait(future) and not future.result():
+				return []
+
+		future, epoch = self.cache.begin(stmt_key, model)
+
+		try:
+			result = await self.session.execute(stmt)
+
+			if is_list:
+				items = list(result.scalars().all())
+			else:
+				item = result.scalars().first()
+				items = [item] if item is not None else []
+
+			if items:
+				self.cache.put(stmt_key, model, items, is_list, epoch)
+
+		except BaseException as e:
+			self.cache.end(stmt_key, model, future, error=e)
+			raise
+
+		self.cache.end(stmt_key, model, future, bool(items))
+
+		return items
+
+	async def query_page(
+		self,
+		model: type[MODEL],
+		joined: list[INST_ATTR] | None = None,
+		cursor: str | None = None,
+		limit: int = 10,
+		offset: int = 0,
+		total: bool = False,
+		columns: list[InstrumentedAttribute] | None = None,
+		**kwargs
+	) -> Page[MODEL]:
+		"""
+		Queries a page of items in primary key order using keyset pagination.
+
+		:param model: The model to query. Must be a subclass of DeclarativeBase.
+		:param joined: A list of InstrumentedAttribute objects to join. Use list for nested joins.
+		:param cursor: The cursor of the previous page, or None for the first page.
+		:param limit: The maximum number of items to return. Capped at PAGE_LIMIT.
+		:param offset: Items to skip, for clients still paging by number. Ignored with a cursor.
+		:param total: Whether to also count every item matching the query parameters.
+		:param columns: Columns to project, which must include the primary key. When given, the page holds Rows of these columns.
+		:param kwargs: The query parameters. When the value is a list, the query will use the IN operator.
+		:return: The page, with the cursor of the next page or None when this is the last one.
+		"""
+
+		limit = max(1, min(limit, cfg.PAGE_LIMIT))
+
+		if cursor is not None:
+			offset = 0
+
+		items = await self.query_list(model, joined, offset=offset, limit=limit + 1, cursor=cursor, columns=columns, **kwargs)
+
+		next_cursor = None
+		if len(items) > limit:
+			items = items[:limit]
+			next_cursor = encode_cursor(items[-1], model if columns else None)
+
+		count = None
+		if total:
+			count_stmt = select(func.count()).select_from(_build_stmt(model, lazy='default', **kwargs).subquery())
+			count = (await self.session.execute(count_stmt)).scalar_one()
+
+		return Page(items, next_cursor, count)
+
+	async def insert_many(
+		self,
+		model: type[DeclarativeBase],
+		rows: list[dict],
+		ignore_conflicts: bool = False
+	) -> int:
+		"""
+		Inserts rows with a single executemany-style statement instead of adding ORM objects one at a time.
+
+		:param model: The model to insert into.
+		:param rows: The column values of each row.
+		:param ignore_conflicts: Whether to skip rows that conflict with existing ones (ON CONFLICT DO NOTHING).
+		:return: The number of inserted rows.
+		"""
+
+		if not rows:
+			return 0
+
+		if ignore_conflicts:
+			pk = inspect(model).primary_key[0]
+			stmt = pg_insert(model).on_conflict_do_nothing().returning(pk)
+
+			result = await self.session.execute(stmt, rows)
+			inserted = len(result.all())
+		else:
+			await self.session.execute(insert(model), rows)
+			inserted = len(rows)
+
+		# new rows cannot make cached ones stale, only the lists they now belong to
+		self.invalidate(model, ())
+
+		return inserted
+
+	async def upsert_many(
+		self,
+		model: type[DeclarativeBase],
+		rows: list[dict],
+		update: list[str]
+	) -> None:
+		"""
+		Inserts rows or updates the given columns of the ones that already exist, in a single
+		INSERT ... ON CONFLICT (primary key) DO UPDATE statement without reading them first.
+
+		:param model: The model to write to.
+		:param rows: The column values of each row. Every row must have a distinct primary key.
+		:param update: The columns overwritten from the new row when its primary key already exists.
+		"""
+
+		if not rows:
+			return
+
+		pk = _pk_columns(model)
+
+		stmt = pg_insert(model).values(rows)
+		stmt = stmt.on_conflict_do_update(
+			index_elements=pk,
+			set_={col: stmt.excluded[col] for col in update}
+		)
+
+		await self.session.execute(stmt)
+
+		for row in rows:
+			self.invalidate(model, tuple(row[col.key] for col in pk))
+
+	def invalidate(self, model: type[DeclarativeBase], pk: tuple | None = None) -> None:
+		"""
+		Invalidates cached results of a model written outside of the unit of work, e.g. by a bulk statement.
+
+		:param model: The written model.
+		:param pk: The primary key of the written row. An empty key only invalidates lists of the model, for inserted rows; None invalidates every cached row.
+		"""
+
+		self.cache.invalidate(model, pk)
+		self._written.append((model, pk))
+		self._events.append((model.__name__, list(pk) if pk is not None else None, None))
+
+	def _execute(self, state: ORMExecuteState):
+		self.statements += 1
+
+		profiled = None
+		if self.profile is not None and isinstance(state.statement, ClauseElement):
+			profiled = self.profile.record(
+				str(state.statement.compile(dialect=self.engine.dialect)),
+				getattr(self.session, 'location', '?')
+			)
+
+		# relationship loads run inside the statement that triggers them
+		if self._depth:
+			return None
+
+		self._depth += 1
+		start = time.perf_counter()
+
+		try:
+			return state.invoke_statement()
+		finally:
+			elapsed = time.perf_counter() - start
+			self.elapsed += elapsed
+			self._depth -= 1
+
+			if profiled is not None:
+				profiled.elapsed = elapsed
+
+	def _after_flush(self, session: Session, _) -> None:
+		deleted = set(session.deleted)
+
+		for obj in (*session.new, *session.dirty, *deleted):
+			mapper = inspect(obj).mapper
+			pk = mapper.primary_key_from_instance(obj)
+
+			self.cache.invalidate(mapper.class_, tuple(pk))
+			self._written.append((mapper.class_, tuple(pk)))
+			self._events.append((mapper.class_.__name__, pk, None if obj in deleted else _version(obj)))
+
+def _subscribe(model: type[DeclarativeBase]) -> None:
+	def invalidate(pk: list | None, _) -> None:
+		DB.cache.invalidate(model, tuple(pk) if pk is not None else None)
+
+	bus.subscribe(model.__name__, invalidate)
+
+for mapper in Base.registry.mappers:
+	_subscribe(mapper.class_)
+
+bus.on_reset(DB.cache.clear)
+
+def _profiled(request: Request) -> bool:
+	if cfg.QUERY_PROFILE_HEADER and request.headers.get(PROFILE_HEADER):
+		return True
+
+	return cfg.QUERY_PROFILE_SAMPLE_RATE > 0 and random.random() < cfg.QUERY_PROFILE_SAMPLE_RATE
+
+async def provide_db(request: Request):
+	profile = None
+
+	if _profiled(request):
+		route = request.scope.get('route')
+		profile = Profile(f'{request.method} {route.path if route else request.url.path}')
+		request.state.query_profile = profile
+
+	async with DB(profile=profile) as db:
 		yield db
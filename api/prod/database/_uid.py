@@ -0,0 +1,178 @@
+from itertools import chain
+from typing import Iterator
+import random, threading, time
+
+# the TSID layout of tsidpy: milliseconds since 2020-01-01, then node and counter bits
+_EPOCH_MS = 1577836800000
+_NODE_BITS = 10
+_COUNTER_BITS = 12
+_COUNTER_MASK = (1 << _COUNTER_BITS) - 1
+
+_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+_PAIRS = [a + b for a in _ALPHABET for b in _ALPHABET]
+_VALUES = {c: i for i, c in enumerate(_ALPHABET)} | {c.lower(): i for i, c in enumerate(_ALPHABET)}
+
+def format_uid(number: int) -> str:
+	"""
+	Formats a TSID number as its canonical 13-character string, ten bits at a time.
+	"""
+
+	return (
+		_ALPHABET[number >> 60] +
+		_PAIRS[number >> 50 & 0x3ff] +
+		_PAIRS[number >> 40 & 0x3ff] +
+		_PAIRS[number >> 30 & 0x3ff] +
+		_PAIRS[number >> 20 & 0x3ff] +
+		_PAIRS[number >> 10 & 0x3ff] +
+		_PAIRS[number & 0x3ff]
+	)
+
+def parse_uid(uid: str) -> int:
+	if len(uid) != 13:
+		raise ValueError(f'Invalid uid: {uid}')
+
+	number = 0
+	try:
+		for c in uid:
+			number = number << 5 | _VALUES[c]
+	except KeyError:
+		raise ValueError(f'Invalid uid: {uid}')
+
+	return number
+
+class UIDAllocator():
+	"""
+	Hands out TSID numbers from an integer counter in blocks of any size.
+
+	A block takes the remaining counter values of the current millisecond and
+	borrows later milliseconds when they run out, so it never waits for the
+	clock and never repeats a number, even if the clock goes backwards. Calls
+	hold no await and take a lock, so they are safe under async tasks and threads.
+	"""
+
+	def __init__(self, node: int | None = None) -> None:
+		if node is None:
+			node = random.getrandbits(_NODE_BITS)
+
+		if not 0 <= node < 1 << _NODE_BITS:
+			raise ValueError(f'Invalid node: {node}')
+
+		self.node = node
+		self._node = node << _COUNTER_BITS
+		self._millis = 0
+		self._counter = 0
+		self._lock = threading.Lock()
+
+	def allocate(self, count: int) -> list[range]:
+		"""
+		Reserves numbers, consecutive within each returned range.
+
+		:param count: The number of numbers.
+		:return: The ranges of the reserved numbers, in increasing order.
+		"""
+
+		blocks = []
+
+		with self._lock:
+			self._tick()
+
+			while count > 0:
+				if self._counter > _COUNTER_MASK:
+					self._millis += 1
+					self._counter = 0
+
+				take = min(count, _COUNTER_MASK + 1 - self._counter)
+				start = self._millis << (_NODE_BITS + _COUNTER_BITS) | self._node | self._counter
+
+				blocks.append(range(start, start + take))
+				self._counter += take
+				count -= take
+
+		return blocks
+
+	def create(self) -> str:
+		with self._lock:
+			self._tick()
+
+			if self._counter > _COUNTER_MASK:
+				self._millis += 1
+				self._counter = 0
+
+			number = self._millis << (_NODE_BITS + _COUNTER_BITS) | self._node | self._counter
+			self._counter += 1
+
+		return format_uid(number)
+
+	def create_many(self, count: int) -> list[str]:
+		return [format_uid(number) for number in chain.from_iterable(self.allocate(count))]
+
+	def wait(self) -> None:
+		"""
+		Sleeps until the clock has passed every millisecond this allocator has used or borrowed.
+
+		A process taking over the same node restarts from the clock, so it must
+		not start before then or it could issue the same numbers again.
+		"""
+
+		with self._lock:
+			ahead = self._millis - (time.time_ns() // 1_000_000 - _EPOCH_MS)
+
+		if ahead >= 0:
+			time.sleep((ahead + 1) / 1000)
+
+	def _tick(self) -> None:
+		now = time.time_ns() // 1_000_000 - _EPOCH_MS
+
+		if now > self._millis:
+			self._millis = now
+			self._counter = 0
+
+_allocator = UIDAllocator()
+
+def set_node(node: int) -> None:
+	"""
+	Generates the uids of this process under a fixed node id, so processes with distinct ids never collide.
+
+	:param node: The node id, below 1024.
+	"""
+
+	global _allocator
+	_allocator = UIDAllocator(node)
+
+def release_node() -> None:
+	"""
+	Waits out the milliseconds used by this process, so a successor under the same node id cannot repeat its uids.
+	"""
+
+	_allocator.wait()
+
+def generate_uid() -> str:
+	return _allocator.create()
+
+def generate_uids(count: int) -> list[str]:
+	return _allocator.create_many(count)
+
+def increment_uid(uid: str, num: int = 1) -> str:
+	return format_uid(parse_uid(uid) + num)
+
+class UIDGenerator:
+	"""
+	Creates uids in increasing order from blocks reserved on the process-wide allocator,
+	formatting each one only when it is used.
+	"""
+
+	def __init__(self, block: int = 256) -> None:
+		self.block = block
+		self.uid = ''
+		self._numbers: Iterator[int] = iter(())
+
+	def create(self) -> str:
+		number = next(self._numbers, None)
+
+		if number is None:
+			self._numbers = chain.from_iterable(_allocator.allocate(self.block))
+			number = next(self._numbers)
+
+		self.uid = format_uid(number)
+
+		return self.uid
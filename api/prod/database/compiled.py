@@ -0,0 +1,13 @@
+from ._compiled import (
+	CompiledQuiz,
+	CompiledQuestion,
+	CompiledAnswer,
+	QuizCache
+)
+
+__all__ = [
+	'CompiledQuiz',
+	'CompiledQuestion',
+	'CompiledAnswer',
+	'QuizCache'
+]
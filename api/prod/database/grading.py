@@ -0,0 +1,9 @@
+from ._grading import (
+	tally,
+	grade_pending
+)
+
+__all__ = [
+	'tally',
+	'grade_pending'
+]
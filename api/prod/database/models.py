@@ -5,9 +5,18 @@ from ._models import (
 	Answer,
 	Assignment,
 	Submission,
+	rng_seed
+)
+from ._uid import (
+	UIDAllocator,
 	UIDGenerator,
+	format_uid,
+	parse_uid,
 	generate_uid,
-	increment_uid
+	generate_uids,
+	increment_uid,
+	release_node,
+	set_node
 )
 
 __all__ = [
@@ -17,7 +26,14 @@ __all__ = [
 	'Answer',
 	'Assignment',
 	'Submission',
+	'UIDAllocator',
 	'UIDGenerator',
+	'format_uid',
+	'parse_uid',
 	'generate_uid',
-	'increment_uid'
+	'generate_uids',
+	'increment_uid',
+	'release_node',
+	'rng_seed',
+	'set_node'
 ]
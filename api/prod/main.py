@@ -1,14 +1,29 @@
-import uvicorn
+import startup
+
+import argparse, asyncio
+
+import config, database, serve
 
 def main():
-	uvicorn.run(
-		'app:app',
-		host='0.0.0.0',
-		port=8000,
-		workers=1,
-		log_level='info',
-		use_colors=True
-	)
+	parser = argparse.ArgumentParser(description='Migrate the database schema and serve the API')
+	parser.add_argument('--skip-migrate', action='store_true', help='Serve without applying migrations')
+	parser.add_argument('--migrate-only', action='store_true', help='Apply migrations and exit')
+	parser.add_argument('--workers', type=int, default=config.workers, help='Worker processes sharing the preloaded app')
+	parser.add_argument('--max-requests', type=int, default=config.max_requests, help='Requests after which a worker is recycled, 0 to never recycle')
+	args = parser.parse_args()
+
+	# autosave buffers are per process, so grading in one worker would miss answers buffered in another
+	if args.workers > 1 and database.autosave.enabled:
+		parser.error('several workers need AUTOSAVE_BUFFER=false, which writes autosaves through')
+
+	if not args.skip_migrate:
+		asyncio.run(database.migrate())
+		startup.timer.mark('migrate')
+
+	if args.migrate_only:
+		return
+
+	serve.serve('0.0.0.0', 8000, args.workers, args.max_requests)
 
 if __name__ == '__main__':
 	main()
@@ -0,0 +1,279 @@
+from bisect import bisect_left
+from typing import Callable, Generic, Iterable, TypeVar
+import time
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+SAMPLE = tuple[str, tuple[str, ...], float]
+
+def _escape(value: str) -> str:
+	return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+	if not names:
+		return ''
+
+	return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+def _format_value(value: float) -> str:
+	if value == float('inf'):
+		return '+Inf'
+	if isinstance(value, int) or value.is_integer():
+		return str(int(value))
+
+	return repr(value)
+
+class Registry():
+	def __init__(self) -> None:
+		self._metrics: list['_Metric'] = []
+
+	def register(self, metric: '_Metric') -> None:
+		if any(m.name == metric.name for m in self._metrics):
+			raise ValueError(f'Duplicate metric {metric.name}')
+
+		self._metrics.append(metric)
+
+	def render(self) -> str:
+		"""
+		Renders every registered metric in the Prometheus text exposition format.
+		"""
+
+		lines = []
+		for metric in self._metrics:
+			lines.append(f'# HELP {metric.name} {metric.help}')
+			lines.append(f'# TYPE {metric.name} {metric.kind}')
+
+			for suffix, values, value in metric.samples():
+				labelnames = metric.labelnames + (('le',) if suffix == '_bucket' else ())
+				lines.append(f'{metric.name}{suffix}{_format_labels(labelnames, values)} {_format_value(value)}')
+
+		return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+class _Metric():
+	kind = 'untyped'
+
+	def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()) -> None:
+		self.name = name
+		self.help = help
+		self.labelnames = tuple(labelnames)
+
+		registry.register(self)
+
+	def samples(self) -> Iterable[SAMPLE]:
+		raise NotImplementedError
+
+class _CounterChild():
+	__slots__ = ('value',)
+
+	def __init__(self) -> None:
+		self.value = 0.0
+
+	def inc(self, amount: float = 1) -> None:
+		self.value += amount
+
+class _GaugeChild(_CounterChild):
+	__slots__ = ()
+
+	def dec(self, amount: float = 1) -> None:
+		self.value -= amount
+
+	def set(self, value: float) -> None:
+		self.value = value
+
+class _HistogramChild():
+	__slots__ = ('bounds', 'counts', 'sum')
+
+	def __init__(self, bounds: tuple[float, ...]) -> None:
+		self.bounds = bounds
+		self.counts = [0] * (len(bounds) + 1)
+		self.sum = 0.0
+
+	def observe(self, value: float) -> None:
+		self.counts[bisect_left(self.bounds, value)] += 1
+		self.sum += value
+
+CHILD = TypeVar('CHILD')
+VALUE = TypeVar('VALUE', bound=_CounterChild)
+
+class _LabeledMetric(_Metric, Generic[CHILD]):
+	"""
+	Metric with children bound once per label combination.
+
+	Callers are expected to keep the children of hot paths, so recording a
+	value is an attribute update without any lookup or allocation.
+	"""
+
+	def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()) -> None:
+		super().__init__(name, help, labelnames)
+		self._children: dict[tuple[str, ...], CHILD] = {}
+
+		if not self.labelnames:
+			self._children[()] = self._child()
+
+	def _child(self) -> CHILD:
+		raise NotImplementedError
+
+	def labels(self, *values: str) -> CHILD:
+		"""
+		Returns the child of a label combination, creating it on first use.
+		"""
+
+		if len(values) != len(self.labelnames):
+			raise ValueError(f'{self.name} expects labels {self.labelnames}')
+
+		child = self._children.get(values)
+		if child is None:
+			child = self._children[values] = self._child()
+
+		return child
+
+class _ValueMetric(_LabeledMetric[VALUE]):
+	def inc(self, amount: float = 1) -> None:
+		self.labels().inc(amount)
+
+	def samples(self) -> Iterable[SAMPLE]:
+		for values, child in self._children.items():
+			yield '', values, child.value
+
+class Counter(_ValueMetric[_CounterChild]):
+	kind = 'counter'
+
+	def _child(self) -> _CounterChild:
+		return _CounterChild()
+
+class Gauge(_ValueMetric[_GaugeChild]):
+	kind = 'gauge'
+
+	def _child(self) -> _GaugeChild:
+		return _GaugeChild()
+
+	def dec(self, amount: float = 1) -> None:
+		self.labels().dec(amount)
+
+	def set(self, value: float) -> None:
+		self.labels().set(value)
+
+class Histogram(_LabeledMetric[_HistogramChild]):
+	kind = 'histogram'
+
+	def __init__(
+		self,
+		name: str,
+		help: str,
+		labelnames: Iterable[str] = (),
+		buckets: Iterable[float] = DEFAULT_BUCKETS
+	) -> None:
+		self.bounds = tuple(sorted(buckets))
+		super().__init__(name, help, labelnames)
+
+	def _child(self) -> _HistogramChild:
+		return _HistogramChild(self.bounds)
+
+	def observe(self, value: float) -> None:
+		self.labels().observe(value)
+
+	def samples(self) -> Iterable[SAMPLE]:
+		for values, child in self._children.items():
+			yield from histogram_samples(values, self.bounds, child.counts, child.sum)
+
+def histogram_samples(
+	values: tuple[str, ...],
+	bounds: tuple[float, ...],
+	counts: list[int],
+	total: float
+) -> Iterable[SAMPLE]:
+	"""
+	Yields the cumulative bucket, sum and count samples of a histogram kept as per-bucket counts.
+
+	:param values: The label values of the histogram.
+	:param bounds: The upper bounds of the buckets, excluding +Inf.
+	:param counts: The number of observations per bucket, with the last one counting values above every bound.
+	:param total: The sum of the observed values.
+	"""
+
+	cumulative = 0
+	for bound, count in zip((*bounds, float('inf')), counts):
+		cumulative += count
+		yield '_bucket', (*values, _format_value(bound)), cumulative
+
+	yield '_sum', values, total
+	yield '_count', values, cumulative
+
+class Collected(_Metric):
+	"""
+	Metric whose samples are read at scrape time from state kept elsewhere.
+
+	:param collect: Returns the value, or a dict of values keyed by label values. Histograms return samples directly.
+	"""
+
+	def __init__(
+		self,
+		name: str,
+		help: str,
+		kind: str,
+		collect: Callable[[], float | dict[tuple[str, ...], float] | list[SAMPLE]],
+		labelnames: Iterable[str] = ()
+	) -> None:
+		self.kind = kind
+		self.collect = collect
+		super().__init__(name, help, labelnames)
+
+	def samples(self) -> Iterable[SAMPLE]:
+		collected = self.collect()
+
+		if isinstance(collected, (int, float)):
+			yield '', (), collected
+		elif isinstance(collected, dict):
+			for values, value in collected.items():
+				yield '', values, value
+		else:
+			yield from collected
+
+REQUEST_SECONDS = Histogram(
+	'quiz_http_request_duration_seconds',
+	'Request latency by route template',
+	['method', 'route']
+)
+REQUESTS_IN_FLIGHT = Gauge('quiz_http_requests_in_flight', 'Requests being served')
+ERRORS = Counter('quiz_http_errors_total', 'Responses with an error status', ['status'])
+
+class MetricsMiddleware():
+	"""
+	ASGI middleware recording request latency, in-flight requests and error statuses.
+
+	Latency is labeled by the matched route template rather than the raw path,
+	so the number of series stays bounded.
+	"""
+
+	def __init__(self, app) -> None:
+		self.app = app
+
+	async def __call__(self, scope, receive, send) -> None:
+		if scope['type'] != 'http':
+			await self.app(scope, receive, send)
+			return
+
+		status_code = 500
+
+		async def send_status(message) -> None:
+			nonlocal status_code
+			if message['type'] == 'http.response.start':
+				status_code = message['status']
+			await send(message)
+
+		REQUESTS_IN_FLIGHT.inc()
+		start = time.perf_counter()
+
+		try:
+			await self.app(scope, receive, send_status)
+		finally:
+			elapsed = time.perf_counter() - start
+			REQUESTS_IN_FLIGHT.dec()
+
+			route = scope.get('route')
+			REQUEST_SECONDS.labels(scope['method'], route.path if route else 'unmatched').observe(elapsed)
+
+			if status_code >= 400:
+				ERRORS.labels(str(status_code)).inc()
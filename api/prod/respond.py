@@ -0,0 +1,67 @@
+from typing import Any, Iterable
+import json
+
+from fastapi import Request, status
+from fastapi.responses import Response
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+def encode(obj: Any) -> bytes:
+	return _encoder.encode(obj).encode('utf-8')
+
+def splice(base: bytes, fields: dict[str, Any]) -> bytes:
+	"""
+	Appends fields to an encoded JSON object without decoding it.
+
+	:param base: The encoded JSON object.
+	:param fields: The fields to append. bytes values are inserted as already-encoded JSON.
+	:return: The encoded JSON object with the fields appended.
+	"""
+
+	if not fields:
+		return base
+
+	parts = [
+		encode(k) + b':' + (v if isinstance(v, bytes) else encode(v))
+		for k, v in fields.items()
+	]
+
+	return base[:-1] + b',' + b','.join(parts) + b'}'
+
+def array(items: Iterable[bytes]) -> bytes:
+	return b'[' + b','.join(items) + b']'
+
+def json_bytes(
+	body: bytes,
+	status_code: int = status.HTTP_200_OK,
+	headers: dict[str, str] | None = None
+) -> Response:
+	return Response(body, status_code=status_code, headers=headers, media_type='application/json')
+
+def etag(*parts: Any) -> str:
+	return '"' + '-'.join(str(part) for part in parts) + '"'
+
+def etag_headers(tag: str) -> dict[str, str]:
+	return {
+		'ETag': tag,
+		'Cache-Control': 'private, no-cache'
+	}
+
+def not_modified(request: Request, tag: str) -> Response | None:
+	"""
+	Returns a 304 response when the request's If-None-Match matches the ETag.
+
+	:param request: The request.
+	:param tag: The current ETag of the resource.
+	:return: A 304 response, or None when the resource must be sent.
+	"""
+
+	header = request.headers.get('if-none-match')
+	if not header:
+		return None
+
+	tags = [t.strip().removeprefix('W/') for t in header.split(',')]
+	if '*' in tags or tag in tags:
+		return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=etag_headers(tag))
+
+	return None
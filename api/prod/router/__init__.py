@@ -1,9 +1,11 @@
 from . import _admin
+from . import _metrics
 from . import _student
 from . import _user
 
 routers = [
 	_admin.router,
+	_metrics.router,
 	_student.router,
 	_user.router
 ]
@@ -1,42 +1,109 @@
-from fastapi import APIRouter, HTTPException, status, Depends, Query
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Request
 from fastapi.responses import Response, JSONResponse
+from sqlalchemy.exc import SQLAlchemyError
 
-import auth, database, schema
+import auth, database, respond, schema
 
 router = APIRouter(tags=['Quiz - Admin'])
 
+async def _import_quiz(db: database.DB, body: schema.quiz.QuizForm) -> str:
+	# one block of uids for the quiz, its questions and answers
+	uid_generator = database.models.UIDGenerator(
+		block=1 + len(body.questions) + sum(len(question.answers) for question in body.questions)
+	)
+	quiz_uid = uid_generator.create()
+
+	questions, answers = [], []
+	for question in body.questions:
+		question_uid = uid_generator.create()
+		questions.append({
+			'uid': question_uid,
+			'quiz_uid': quiz_uid,
+			'text': question.text
+		})
+
+		for answer in question.answers:
+			answers.append({
+				'uid': uid_generator.create(),
+				'question_uid': question_uid,
+				'text': answer.text,
+				'correct': answer.correct
+			})
+
+	await db.insert_many(database.models.Quiz, [{
+		'uid': quiz_uid,
+		'title': body.title,
+		'question_count': body.question_count,
+		'per_page': body.per_page,
+		'shuffle_questions': body.shuffle_questions,
+		'shuffle_answers': body.shuffle_answers
+	}])
+	await db.insert_many(database.models.Question, questions)
+	await db.insert_many(database.models.Answer, answers)
+
+	return quiz_uid
+
 @router.post('/admin/promote', status_code=status.HTTP_200_OK)
 async def promote_user(
 	code: str = Depends(auth.query('code')),
 	token: str = Depends(auth.oauth2),
 	db: database.DB = Depends(database.provide_db)
 ) -> Response:
+	db.expect(2)
+
 	if not auth.confirm_code(code):
 		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST)
 
-	db_user = await auth.jwt2user(db, token)
+	user = await auth.jwt2user(db, token)
+
+	db_user = await db.query_item(database.models.User, uid=user.uid)
+
+	if not db_user:
+		raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
 	db_user.is_admin = True
+	db_user.token_version += 1
+
+	# evicted once committed, or a concurrent request could cache the old principal again
+	uid, version = db_user.uid, db_user.token_version
+	db.on_commit(lambda: auth.invalidate_user(uid, version))
 
 	return Response(status_code=status.HTTP_200_OK)
 
-@router.get('/admin/quiz', response_model=dict[str, schema.quiz.QuizViewAdmin])
+@router.get('/admin/quiz', response_model=list[schema.quiz.QuizViewAdmin])
 async def get_all_quizzes(
-	page: int = Query(0, ge=0),
-	limit: int = Query(10, ge=1),
+	cursor: str | None = Query(None),
+	page: int | None = Query(None, ge=0, deprecated=True, description='Use cursor instead'),
+	limit: int = Query(10, ge=1, le=database.PAGE_LIMIT),
+	total: bool = Query(False),
 	token: str = Depends(auth.oauth2),
 	db: database.DB = Depends(database.provide_db)
 ) -> Response:
+	db.expect(3)
+
 	await auth.jwt2user(db, token, admin=True)
 
-	quizzes = await db.query_list(
-		database.models.Quiz,
-		page=page,
-		limit=limit,
-	)
+	try:
+		db_page = await db.query_page(
+			database.models.Quiz,
+			cursor=cursor,
+			limit=limit,
+			offset=(page or 0) * limit,
+			total=total
+		)
+	except ValueError as e:
+		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
-	return JSONResponse(
-		[quiz.dump() for quiz in quizzes],
-		status_code=status.HTTP_200_OK
+	headers = {}
+	if db_page.cursor:
+		headers['X-Next-Cursor'] = db_page.cursor
+	if db_page.total is not None:
+		headers['X-Total-Count'] = str(db_page.total)
+
+	return respond.json_bytes(
+		respond.encode([quiz.dump() for quiz in db_page.items]),
+		status.HTTP_200_OK,
+		headers
 	)
 
 @router.post('/admin/quiz', response_model=str, status_code=status.HTTP_201_CREATED)
@@ -45,77 +112,136 @@ async def create_quiz(
 	token: str = Depends(auth.oauth2),
 	db: database.DB = Depends(database.provide_db)
 ) -> Response:
+	db.expect(4)
+
 	await auth.jwt2user(db, token, admin=True)
 
-	uid_generator = database.models.UIDGenerator(ordered=True)
+	quiz_uid = await _import_quiz(db, body)
 
-	db_quiz = database.models.Quiz(
-		uid=uid_generator.create(),
-		title=body.title,
-		question_count=body.question_count,
-		per_page=body.per_page,
-		shuffle_questions=body.shuffle_questions,
-		shuffle_answers=body.shuffle_answers
-	)
+	return Response(quiz_uid, status_code=status.HTTP_201_CREATED)
 
-	for question in body.questions:
-		db_question = database.models.Question(
-			uid=uid_generator.create(),
-			quiz_uid=db_quiz.uid,
-			text=question.text
-		)
-		db.session.add(db_question)
+@router.post('/admin/quiz/import', response_model=list[dict], status_code=status.HTTP_200_OK)
+async def import_quizzes(
+	request: Request,
+	token: str = Depends(auth.oauth2),
+	db: database.DB = Depends(database.provide_db)
+) -> Response:
+	await auth.jwt2user(db, token, admin=True)
 
-		for answer in question.answers:
-			db_answer = database.models.Answer(
-				uid=uid_generator.create(),
-				question_uid=db_question.uid,
-				text=answer.text,
-				correct=answer.correct
-			)
-			db.session.add(db_answer)
+	res = []
+	line_count = 0
+	buffer = b''
+
+	async def _import_line(line_no: int, line: bytes) -> None:
+		if not line.strip():
+			return
+
+		try:
+			body = schema.quiz.QuizForm.model_validate_json(line)
+			async with db.session.begin_nested():
+				quiz_uid = await _import_quiz(db, body)
+			res.append({'line': line_no, 'uid': quiz_uid})
 
-	db.session.add(db_quiz)
+		except (ValueError, SQLAlchemyError) as e:
+			res.append({'line': line_no, 'error': str(e)})
 
-	return Response(db_quiz.uid, status_code=status.HTTP_201_CREATED)
+	async for chunk in request.stream():
+		buffer += chunk
+		*lines, buffer = buffer.split(b'\n')
+
+		for line_no, line in enumerate(lines, start=line_count + 1):
+			await _import_line(line_no, line)
+		line_count += len(lines)
+
+	line_count += 1
+	await _import_line(line_count, buffer)
+
+	# declared once the lines are counted: the token, then the quiz, question and answer inserts of each line
+	db.expect(1 + 3 * line_count)
+
+	return JSONResponse(res, status_code=status.HTTP_200_OK)
 
 @router.get('/admin/quiz/{uid}', response_model=schema.quiz.QuizViewAdmin)
 async def get_quiz_details(
+	request: Request,
 	uid: str = Depends(auth.path('uid')),
 	token: str = Depends(auth.oauth2),
 	db: database.DB = Depends(database.provide_db)
 ) -> Response:
+	db.expect(4)
+
 	await auth.jwt2user(db, token, admin=True)
 
-	db_quiz = await db.query_item(database.models.Quiz, uid=uid)
+	db_quiz = await database.quiz_cache.get(db, uid)
 
 	if not db_quiz:
 		raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
-	return JSONResponse(db_quiz.dump(), status_code=status.HTTP_200_OK)
+	tag = respond.etag(db_quiz.version)
+
+	res_304 = respond.not_modified(request, tag)
+	if res_304:
+		return res_304
+
+	return respond.json_bytes(db_quiz.encoded, status.HTTP_200_OK, respond.etag_headers(tag))
 
 @router.get('/admin/quiz/{uid}/questions', response_model=schema.quiz.QuizForm)
 async def get_quiz_full_questions(
+	request: Request,
 	uid: str = Depends(auth.path('uid')),
 	page: int = Query(0, ge=0),
 	token: str = Depends(auth.oauth2),
 	db: database.DB = Depends(database.provide_db)
 ) -> Response:
+	db.expect(4)
+
 	await auth.jwt2user(db, token, admin=True)
 
-	db_quiz = await db.query_item(database.models.Quiz, uid=uid)
+	db_quiz = await database.quiz_cache.get(db, uid)
+
+	if not db_quiz or page >= db_quiz.page_count:
+		raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+	tag = respond.etag(db_quiz.version)
+
+	res_304 = respond.not_modified(request, tag)
+	if res_304:
+		return res_304
+
+	return respond.json_bytes(db_quiz.admin_page(page), status.HTTP_200_OK, respond.etag_headers(tag))
+
+@router.post('/admin/quiz/{uid}/grade', response_model=schema.quiz.GradeResult, status_code=status.HTTP_200_OK)
+async def grade_pending(
+	uid: str = Depends(auth.path('uid')),
+	token: str = Depends(auth.oauth2),
+	db: database.DB = Depends(database.provide_db)
+) -> Response:
+	db.expect(5)
+
+	await auth.jwt2user(db, token, admin=True)
+
+	db_quiz = await database.quiz_cache.get(db, uid)
 
 	if not db_quiz:
 		raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
-	res = db_quiz.dump()
-	res['questions'] = [
-		question.dump()
-		for question
-		in db_quiz.q_select(page=page, admin=True)
-	]
+	# autosaved answers must be scored, as in the student's own grade
+	await database.autosave.flush()
 
-	return JSONResponse(res, status_code=status.HTTP_200_OK)
+	graded = await database.grading.grade_pending(db, uid)
+
+	def _discard() -> None:
+		for user_uid, _ in graded:
+			database.autosave.discard(user_uid, uid)
+
+	# answers autosaved while grading are no longer accepted
+	db.on_commit(_discard)
+
+	json_res = {
+		'graded': len(graded),
+		'scores': {user_uid: score for user_uid, score in graded}
+	}
+	return JSONResponse(json_res, status_code=status.HTTP_200_OK)
 
 @router.post('/admin/assign', response_model=None, status_code=status.HTTP_201_CREATED)
 async def assign_quiz(
@@ -124,18 +250,91 @@ async def assign_quiz(
 	token: str = Depends(auth.oauth2),
 	db: database.DB = Depends(database.provide_db)
 ) -> Response:
+	db.expect(5)
+
 	await auth.jwt2user(db, token, admin=True)
 
-	db_user = await db.query_item(database.models.User, uid=user_uid)
-	db_quiz = await db.query_item(database.models.Quiz, uid=quiz_uid)
+	db_user = await db.query_row(
+		database.models.User,
+		columns=[database.models.User.uid],
+		uid=user_uid
+	)
+	db_quiz = await database.quiz_cache.get(db, quiz_uid)
 
 	if not db_user or not db_quiz:
 		raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
+	seed = database.models.rng_seed()
+
+	try:
+		permutation = db_quiz.permute(seed)
+	except ValueError as e:
+		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
 	db_assignment = database.models.Assignment(
 		user_uid=db_user.uid,
-		quiz_uid=db_quiz.uid
+		quiz_uid=db_quiz.uid,
+		rng_seed=seed,
+		permutation=permutation
 	)
 	db.session.add(db_assignment)
 
 	return Response(status_code=status.HTTP_201_CREATED)
+
+@router.post('/admin/assign/batch', response_model=schema.quiz.AssignResult, status_code=status.HTTP_200_OK)
+async def assign_quiz_batch(
+	body: schema.quiz.AssignBatch,
+	token: str = Depends(auth.oauth2),
+	db: database.DB = Depends(database.provide_db)
+) -> Response:
+	db.expect(6)
+
+	await auth.jwt2user(db, token, admin=True)
+
+	db_users = await db.query_list(
+		database.models.User,
+		columns=[database.models.User.uid],
+		uid=body.users
+	)
+	db_quizzes = await database.quiz_cache.get_many(db, body.quizzes)
+
+	missing_users = set(body.users) - {db_user.uid for db_user in db_users}
+	missing_quizzes = set(body.quizzes) - db_quizzes.keys()
+
+	if missing_users or missing_quizzes:
+		raise HTTPException(
+			status_code=status.HTTP_404_NOT_FOUND,
+			detail={
+				'users': sorted(missing_users),
+				'quizzes': sorted(missing_quizzes)
+			}
+		)
+
+	rows = []
+	for quiz_uid in body.quizzes:
+		db_quiz = db_quizzes[quiz_uid]
+
+		for user_uid in body.users:
+			seed = database.models.rng_seed()
+
+			try:
+				permutation = db_quiz.permute(seed)
+			except ValueError as e:
+				raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f'{quiz_uid}: {e}')
+
+			rows.append({
+				'user_uid': user_uid,
+				'quiz_uid': quiz_uid,
+				'rng_seed': seed,
+				'permutation': permutation,
+				'completed': False,
+				'score': -1.0
+			})
+
+	created = await db.insert_many(database.models.Assignment, rows, ignore_conflicts=True)
+
+	json_res = {
+		'created': created,
+		'skipped': len(rows) - created
+	}
+	return JSONResponse(json_res, status_code=status.HTTP_200_OK)
@@ -0,0 +1,125 @@
+from fastapi import APIRouter, status
+from fastapi.responses import PlainTextResponse
+
+import admission, auth, database, metrics
+
+router = APIRouter(tags=['Metrics'])
+
+def _caches() -> dict:
+	return {
+		'query': database.DB.cache,
+		'quiz': database.quiz_cache,
+		'principal': auth.principal_cache
+	}
+
+def _flights() -> dict:
+	return {
+		'query': database.DB.cache.flight,
+		'quiz': database.quiz_cache.flight
+	}
+
+def _pool_wait() -> list[metrics.SAMPLE]:
+	pool = database.pool_status()
+	buckets = pool['wait_buckets']
+
+	return list(metrics.histogram_samples(
+		(),
+		tuple(buckets.keys())[:-1],
+		list(buckets.values()),
+		pool['wait_sum']
+	))
+
+metrics.Collected(
+	'quiz_cache_hits_total', 'Cache hits', 'counter',
+	lambda: {(name,): cache.hits for name, cache in _caches().items()},
+	['cache']
+)
+metrics.Collected(
+	'quiz_cache_misses_total', 'Cache misses', 'counter',
+	lambda: {(name,): cache.misses for name, cache in _caches().items()},
+	['cache']
+)
+metrics.Collected(
+	'quiz_cache_entries', 'Cached entries', 'gauge',
+	lambda: {(name,): len(cache) for name, cache in _caches().items()},
+	['cache']
+)
+metrics.Collected(
+	'quiz_cache_loads_total', 'Cache misses loaded from the database, once for every concurrent miss on a key', 'counter',
+	lambda: {(name,): flight.loads for name, flight in _flights().items()},
+	['cache']
+)
+metrics.Collected(
+	'quiz_cache_coalesced_total', 'Cache misses served by waiting for a load already in flight', 'counter',
+	lambda: {(name,): flight.coalesced for name, flight in _flights().items()},
+	['cache']
+)
+metrics.Collected(
+	'quiz_hash_pool_pending', 'bcrypt calls running or waiting for a worker', 'gauge',
+	lambda: auth.hash_pool.pending
+)
+metrics.Collected(
+	'quiz_hash_pool_rejected_total', 'bcrypt calls rejected because the queue was full', 'counter',
+	lambda: auth.hash_pool.rejected
+)
+metrics.Collected(
+	'quiz_admission_active', 'Requests admitted and being served', 'gauge',
+	lambda: admission.gate.active
+)
+metrics.Collected(
+	'quiz_admission_waiting', 'Requests waiting for admission', 'gauge',
+	lambda: admission.gate.waiting
+)
+metrics.Collected(
+	'quiz_admission_clients', 'Clients with a token bucket', 'gauge',
+	lambda: {(route_class,): len(buckets) for route_class, buckets in admission.buckets.items()},
+	['route_class']
+)
+metrics.Collected(
+	'quiz_cache_bus_connected', 'Whether the cache invalidation listener is connected', 'gauge',
+	lambda: int(database.bus.connected)
+)
+metrics.Collected(
+	'quiz_cache_bus_published_total', 'Cache invalidation notifications sent', 'counter',
+	lambda: database.bus.published
+)
+metrics.Collected(
+	'quiz_cache_bus_received_total', 'Cache invalidation events received from other workers', 'counter',
+	lambda: database.bus.received
+)
+metrics.Collected(
+	'quiz_cache_bus_reconnects_total', 'Listener reconnects, each resetting every cache', 'counter',
+	lambda: database.bus.reconnects
+)
+metrics.Collected(
+	'quiz_autosave_pending', 'Autosaved answers waiting for a flush', 'gauge',
+	lambda: len(database.autosave)
+)
+metrics.Collected(
+	'quiz_autosave_flushed_total', 'Autosaved answers written to the database', 'counter',
+	lambda: database.autosave.flushed
+)
+metrics.Collected(
+	'quiz_autosave_flush_failures_total', 'Autosave flushes that failed and were retried', 'counter',
+	lambda: database.autosave.failures
+)
+metrics.Collected(
+	'quiz_db_pool_checked_out', 'Connections checked out of the pool', 'gauge',
+	lambda: database.pool_status()['checked_out']
+)
+metrics.Collected(
+	'quiz_db_pool_timeouts_total', 'Checkouts that timed out waiting for a connection', 'counter',
+	lambda: database.pool_status()['timeouts']
+)
+metrics.Collected(
+	'quiz_db_pool_checkout_seconds', 'Time spent waiting for a connection', 'histogram',
+	_pool_wait
+)
+
+@router.get('/metrics', include_in_schema=False)
+async def get_metrics() -> PlainTextResponse:
+	return PlainTextResponse(
+		metrics.registry.render(),
+		status_code=status.HTTP_200_OK,
+		media_type='text/plain; version=0.0.4'
+	)
@@ -1,93 +1,203 @@
-from fastapi import APIRouter, HTTPException, status, Depends, Query
-from fastapi.responses import Response, JSONResponse
+from typing import cast
 
-import auth, database, schema
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Request
+from fastapi.responses import Response
+
+import auth, database, respond, schema
 
 router = APIRouter(tags=['Quiz - Student'])
 
-@router.get('/student/quiz', response_model=dict[str, schema.quiz.QuizViewStudent])
+def _permutation(
+	db_assignment: database.models.Assignment,
+	db_quiz: database.compiled.CompiledQuiz
+) -> bytes:
+	if not db_quiz.permuted(db_assignment.permutation):
+		db_assignment.permutation = db_quiz.permute(db_assignment.rng_seed)
+
+	return cast(bytes, db_assignment.permutation)
+
+def _selections(
+	curr_q: list[tuple[database.compiled.CompiledQuestion, tuple[int, ...]]],
+	answers: list[schema.quiz.AnswerSelection]
+) -> dict[str, str]:
+	selections = {}
+
+	for ans in answers:
+		if ans.question_idx >= len(curr_q):
+			raise HTTPException(
+				status_code=status.HTTP_400_BAD_REQUEST,
+				detail='Question number out of range'
+			)
+
+		question, order = curr_q[ans.question_idx]
+		if ans.answer_idx >= len(order):
+			raise HTTPException(
+				status_code=status.HTTP_400_BAD_REQUEST,
+				detail='Answer number out of range'
+			)
+
+		selections[question.uid] = question.answers[order[ans.answer_idx]].uid
+
+	return selections
+
+@router.get('/student/quiz', response_model=list[schema.quiz.QuizViewStudent])
 async def get_assigned_quizzes(
-	page: int = Query(0, ge=0),
-	limit: int = Query(10, ge=1),
+	request: Request,
+	cursor: str | None = Query(None),
+	page: int | None = Query(None, ge=0, deprecated=True, description='Use cursor instead'),
+	limit: int = Query(10, ge=1, le=database.PAGE_LIMIT),
+	total: bool = Query(False),
 	token: str = Depends(auth.oauth2),
 	db: database.DB = Depends(database.provide_db)
 ) -> Response:
-	db_user = await auth.jwt2user(db, token)
+	db.expect(6)
+
+	user = await auth.jwt2user(db, token)
+
+	# a projection without the permutations is enough to tag the page, before any quiz is loaded
+	try:
+		db_page = await db.query_page(
+			database.models.Assignment,
+			cursor=cursor,
+			limit=limit,
+			offset=(page or 0) * limit,
+			total=total,
+			columns=[
+				database.models.Assignment.user_uid,
+				database.models.Assignment.quiz_uid,
+				database.models.Assignment.version,
+				database.models.Assignment.completed,
+				database.models.Assignment.score
+			],
+			user_uid=user.uid
+		)
+	except ValueError as e:
+		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+	# quizzes are never edited in place, so the assignment versions cover every change to the page;
+	# the next cursor covers assignments added after a full last page
+	tag = respond.etag(*(f'{a.quiz_uid}.{a.version}' for a in db_page.items), db_page.cursor, db_page.total)
 
-	await db.session.run_sync(lambda s: s.refresh(db_user, ['assignments']))
+	res_304 = respond.not_modified(request, tag)
+	if res_304:
+		return res_304
 
-	assignments = db_user.assignments[page * limit:(page + 1) * limit]
+	db_quizzes = await database.quiz_cache.get_many(
+		db,
+		[assignment.quiz_uid for assignment in db_page.items]
+	)
 
 	res = []
-	for assignment in assignments:
-		res.append(assignment.quiz.dump())
-		res[-1]['completed'] = assignment.completed
-		res[-1]['score'] = assignment.score
+	for assignment in db_page.items:
+		if assignment.quiz_uid not in db_quizzes:
+			continue
 
-	return JSONResponse(res, status_code=status.HTTP_200_OK)
+		res.append(respond.splice(db_quizzes[assignment.quiz_uid].encoded, {
+			'completed': assignment.completed,
+			'score': assignment.score
+		}))
+
+	headers = respond.etag_headers(tag)
+	if db_page.cursor:
+		headers['X-Next-Cursor'] = db_page.cursor
+	if db_page.total is not None:
+		headers['X-Total-Count'] = str(db_page.total)
+
+	return respond.json_bytes(respond.array(res), status.HTTP_200_OK, headers)
 
 @router.get('/student/quiz/{uid}', response_model=schema.quiz.QuizViewStudent)
 async def get_quiz_details(
+	request: Request,
 	uid: str = Depends(auth.path('uid')),
 	token: str = Depends(auth.oauth2),
 	db: database.DB = Depends(database.provide_db)
 ) -> Response:
-	db_user = await auth.jwt2user(db, token)
+	db.expect(5)
+
+	user = await auth.jwt2user(db, token)
 
 	db_assignment = await db.query_item(
 		database.models.Assignment,
-		user_uid=db_user.uid,
+		cache=True,
+		user_uid=user.uid,
 		quiz_uid=uid
 	)
 
 	if not db_assignment:
 		raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
-	res = db_assignment.quiz.dump()
-	res['completed'] = db_assignment.completed
-	res['score'] = db_assignment.score
+	db_quiz = await database.quiz_cache.get(db, uid)
+
+	if not db_quiz:
+		raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+	tag = respond.etag(db_quiz.version, db_assignment.version)
+
+	res_304 = respond.not_modified(request, tag)
+	if res_304:
+		return res_304
+
+	res = respond.splice(db_quiz.encoded, {
+		'completed': db_assignment.completed,
+		'score': db_assignment.score
+	})
 
-	return JSONResponse(res, status_code=status.HTTP_200_OK)
+	return respond.json_bytes(res, status.HTTP_200_OK, respond.etag_headers(tag))
 
 @router.get('/student/quiz/{uid}/questions', response_model=schema.quiz.QuizViewTest)
 async def get_quiz_questions(
+	request: Request,
 	uid: str = Depends(auth.path('uid')),
 	page: int = Query(0, ge=0),
 	token: str = Depends(auth.oauth2),
 	db: database.DB = Depends(database.provide_db)
 ) -> Response:
-	db_user = await auth.jwt2user(db, token)
+	db.expect(6)
+
+	user = await auth.jwt2user(db, token)
 
 	db_assignment = await db.query_item(
 		database.models.Assignment,
-		user_uid=db_user.uid,
+		cache=True,
+		user_uid=user.uid,
 		quiz_uid=uid
 	)
 
 	if not db_assignment:
 		raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
+	db_quiz = await database.quiz_cache.get(db, uid)
+
+	if not db_quiz:
+		raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+	tag = respond.etag(db_quiz.version, db_assignment.version, database.autosave.revision(user.uid, uid))
+
+	res_304 = respond.not_modified(request, tag)
+	if res_304:
+		return res_304
+
+	db_questions = db_quiz.q_select(page=page, permutation=_permutation(db_assignment, db_quiz))
+
 	db_subs = await db.query_list(
 		database.models.Submission,
-		user_uid=db_user.uid,
-		question_uid=[q.uid for q in db_assignment.quiz.questions]
+		user_uid=user.uid,
+		question_uid=[q.uid for q, _ in db_questions]
 	)
-	q2sub = {sub.question_uid: sub for sub in db_subs}
-	db_questions = db_assignment.quiz.q_select(page=page, seed=db_assignment.rng_seed)
+	q2ans = {sub.question_uid: sub.answer_uid for sub in db_subs} | database.autosave.pending(user.uid, uid)
 
 	questions = []
-	for question in db_questions:
-		questions.append(question.dump())
-		questions[-1]['selected'] = -1
+	for question, order in db_questions:
+		selected = -1
+
+		if question.uid in q2ans.keys():
+			selected = order.index(question.index(q2ans[question.uid]))
 
-		if question.uid in q2sub.keys():
-			sub = q2sub[question.uid]
-			questions[-1]['selected'] = question.answers.index(sub.answer)
+		questions.append(question.encode(order, selected))
 
-	res = db_assignment.quiz.dump()
-	res['questions'] = questions
+	res = respond.splice(db_quiz.encoded, {'questions': respond.array(questions)})
 
-	return JSONResponse(res, status_code=status.HTTP_200_OK)
+	return respond.json_bytes(res, status.HTTP_200_OK, respond.etag_headers(tag))
 
 @router.post('/student/quiz/{uid}/submit', response_model=None, status_code=status.HTTP_200_OK)
 async def submit_answer(
@@ -96,12 +206,14 @@ async def submit_answer(
 	token: str = Depends(auth.oauth2),
 	db: database.DB = Depends(database.provide_db)
 ) -> Response:
-	db_user = await auth.jwt2user(db, token)
+	db.expect(5)
+
+	user = await auth.jwt2user(db, token)
 
 	db_assignment = await db.query_item(
 		database.models.Assignment,
-		cache=True,
-		user_uid=db_user.uid,
+		lock=True,
+		user_uid=user.uid,
 		quiz_uid=uid
 	)
 
@@ -114,58 +226,104 @@ async def submit_answer(
 			detail='Quiz has already been graded'
 		)
 
-	curr_q = db_assignment.quiz.q_select(
+	db_quiz = await database.quiz_cache.get(db, uid)
+
+	if not db_quiz:
+		raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+	curr_q = db_quiz.q_select(
 		page=body.page_idx,
-		seed=db_assignment.rng_seed
+		permutation=_permutation(db_assignment, db_quiz)
 	)
 
-	ans_subs = await db.query_list(
-		database.models.Submission,
-		user_uid=db_user.uid,
-		question_uid=[q.uid for q in curr_q]
-	)
-	sub_dict = {a.question_uid: a for a in ans_subs}
+	selections = _selections(curr_q, body.answers)
 
-	for ans in body.answers:
-		if ans.question_idx >= len(curr_q):
-			raise HTTPException(
-				status_code=status.HTTP_400_BAD_REQUEST,
-				detail='Question number out of range'
-			)
+	await db.upsert_many(database.models.Submission, [{
+		'user_uid': user.uid,
+		'question_uid': question_uid,
+		'answer_uid': answer_uid
+	} for question_uid, answer_uid in selections.items()], update=['answer_uid'])
 
-		question = curr_q[ans.question_idx]
-		if ans.answer_idx >= len(question.answers):
-			raise HTTPException(
-				status_code=status.HTTP_400_BAD_REQUEST,
-				detail='Answer number out of range'
-			)
+	database.autosave.discard(user.uid, uid, list(selections))
 
-		question.shuffle_ans(db_assignment.rng_seed)
-		ans_uid = question.answers[ans.answer_idx].uid
-		if question.uid in sub_dict.keys():
-			sub_dict[question.uid].answer_uid = ans_uid
-		else:
-			new_sub = database.models.Submission(
-				user_uid=db_user.uid,
-				question_uid=question.uid,
-				answer_uid=ans_uid
-			)
-			db.session.add(new_sub)
-			sub_dict[question.uid] = new_sub
+	db_assignment.version += 1
 
 	return Response(status_code=status.HTTP_200_OK)
 
+@router.post('/student/quiz/{uid}/autosave', response_model=None, status_code=status.HTTP_202_ACCEPTED)
+async def autosave_answer(
+	body: schema.quiz.SubmitAnswer,
+	uid: str = Depends(auth.path('uid')),
+	token: str = Depends(auth.oauth2),
+	db: database.DB = Depends(database.provide_db)
+) -> Response:
+	db.expect(5)
+
+	user = await auth.jwt2user(db, token)
+
+	# a cached assignment could be stale, e.g. graded by another worker; written through, it is locked as in submit
+	db_assignment = await db.query_item(
+		database.models.Assignment,
+		lock=not database.autosave.enabled,
+		user_uid=user.uid,
+		quiz_uid=uid
+	)
+
+	if not db_assignment:
+		raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+	if db_assignment.completed:
+		raise HTTPException(
+			status_code=status.HTTP_400_BAD_REQUEST,
+			detail='Quiz has already been graded'
+		)
+
+	db_quiz = await database.quiz_cache.get(db, uid)
+
+	if not db_quiz:
+		raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+	curr_q = db_quiz.q_select(
+		page=body.page_idx,
+		permutation=_permutation(db_assignment, db_quiz)
+	)
+
+	selections = _selections(curr_q, body.answers)
+
+	if database.autosave.enabled:
+		# written by the autosave flush rather than this unit of work
+		database.autosave.put(user.uid, uid, selections)
+		return Response(status_code=status.HTTP_202_ACCEPTED)
+
+	# other workers could not see a buffered answer when grading, so it is written like a submission
+	await db.upsert_many(database.models.Submission, [{
+		'user_uid': user.uid,
+		'question_uid': question_uid,
+		'answer_uid': answer_uid
+	} for question_uid, answer_uid in selections.items()], update=['answer_uid'])
+
+	db_assignment.version += 1
+
+	return Response(status_code=status.HTTP_202_ACCEPTED)
+
 @router.post('/student/quiz/{uid}/grade', response_model=None, status_code=status.HTTP_200_OK)
 async def grade_quiz(
 	uid: str = Depends(auth.path('uid')),
 	token: str = Depends(auth.oauth2),
 	db: database.DB = Depends(database.provide_db)
 ) -> Response:
-	db_user = await auth.jwt2user(db, token)
+	db.expect(6)
+
+	user = await auth.jwt2user(db, token)
+
+	# autosaved answers must be scored, and their flush bumps the version read below
+	await database.autosave.flush()
 
+	# locked, so a concurrent autosave flush cannot write into the assignment while it is graded
 	db_assignment = await db.query_item(
 		database.models.Assignment,
-		user_uid=db_user.uid,
+		lock=True,
+		user_uid=user.uid,
 		quiz_uid=uid
 	)
 
@@ -178,19 +336,28 @@ async def grade_quiz(
 			detail='Quiz has already been graded'
 		)
 
-	db_subs = await db.query_list(
-		database.models.Submission,
-		user_uid=db_user.uid,
-		question_uid=[q.uid for q in db_assignment.quiz.questions]
+	db_quiz = await database.quiz_cache.get(db, uid)
+
+	if not db_quiz:
+		raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+	answered, correct = await database.grading.tally(
+		db,
+		user.uid,
+		db_quiz.selected_uids(_permutation(db_assignment, db_quiz))
 	)
 
-	if len(db_subs) != db_assignment.quiz.question_count:
+	if answered != db_quiz.question_count:
 		raise HTTPException(
 			status_code=status.HTTP_400_BAD_REQUEST,
 			detail='Not all questions have been answered'
 		)
 
 	db_assignment.completed = True
-	db_assignment.score = sum(db_sub.answer.correct for db_sub in db_subs)
+	db_assignment.score = correct
+	db_assignment.version += 1
+
+	# answers autosaved while grading are no longer accepted
+	db.on_commit(lambda: database.autosave.discard(user.uid, uid))
 
 	return Response(status_code=status.HTTP_200_OK)
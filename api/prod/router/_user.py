@@ -11,7 +11,13 @@ async def create_user(
 	user: schema.user.UserCreate,
 	db: database.DB = Depends(database.provide_db)
 ) -> Response:
-	db_user = await db.query_item(database.models.User, username=user.username)
+	db.expect(1)
+
+	db_user = await db.query_row(
+		database.models.User,
+		columns=[database.models.User.uid],
+		username=user.username
+	)
 	if db_user:
 		raise HTTPException(
 			status_code=status.HTTP_409_CONFLICT,
@@ -21,13 +27,13 @@ async def create_user(
 
 	db_user = database.models.User(
 		username=user.username,
-		hashed_pw=auth.bcrypt_hash(user.password),
-		is_admin=False
+		hashed_pw=await auth.hash_password(user.password),
+		is_admin=False,
+		token_version=0
 	)
 	db.session.add(db_user)
 
 	await db.session.commit()
-	await db.session.refresh(db_user)
 
 	return Response(db_user.uid, status_code=status.HTTP_201_CREATED)
 
@@ -36,6 +42,8 @@ async def login_for_token(
 	oauth2: OAuth2PasswordRequestForm = Depends(),
 	db: database.DB = Depends(database.provide_db)
 ) -> Response:
+	db.expect(1)
+
 	db_user = await db.query_item(database.models.User, username=oauth2.username)
 	if db_user is None:
 		raise HTTPException(
@@ -44,15 +52,21 @@ async def login_for_token(
 			headers={'WWW-Authenticate': 'Bearer'}
 		)
 
-	if not auth.bcrypt_verify(oauth2.password, db_user.hashed_pw):
+	if not await auth.verify_password(oauth2.password, db_user.hashed_pw):
 		raise HTTPException(
 			status_code=status.HTTP_401_UNAUTHORIZED,
 			detail='Could not validate credentials',
 			headers={'WWW-Authenticate': 'Bearer'}
 		)
 
+	if auth.bcrypt_needs_rehash(db_user.hashed_pw):
+		db_user.hashed_pw = await auth.hash_password(oauth2.password)
+
 	access_token = auth.create_jwt(
 		db_user.username,
+		uid=db_user.uid,
+		is_admin=db_user.is_admin,
+		version=db_user.token_version,
 		expire_mins=60
 	)
 
@@ -1,4 +1,8 @@
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, field_validator, model_validator
+
+# assignments store question and answer orders as uint16
+MAX_QUESTIONS = 0xffff
+MAX_ANSWERS = 0xffff
 
 class UID(BaseModel):
 	uid: str
@@ -16,6 +20,9 @@ class QuestionView(BaseModel):
 		if len(answers) < 2:
 			raise ValueError('At least two answers are required')
 
+		if len(answers) > MAX_ANSWERS:
+			raise ValueError(f'At most {MAX_ANSWERS} answers are allowed')
+
 		if sum(answer.correct for answer in answers) != 1:
 			raise ValueError('Exactly one answer must be correct')
 
@@ -34,6 +41,20 @@ class QuizBase(BaseModel):
 class QuizForm(QuizBase):
 	questions: list[QuestionView]
 
+	@field_validator('questions')
+	def check_questions(cls, questions: list[QuestionView]) -> list[QuestionView]:
+		if len(questions) > MAX_QUESTIONS:
+			raise ValueError(f'At most {MAX_QUESTIONS} questions are allowed')
+
+		return questions
+
+	@model_validator(mode='after')
+	def check_question_count(self) -> 'QuizForm':
+		if not 0 <= self.question_count <= len(self.questions):
+			raise ValueError('Question count must be between 0 and the number of questions')
+
+		return self
+
 class QuizViewAdmin(UID, QuizBase):
 	pass
 
@@ -54,6 +75,7 @@ class AnswerSelection(BaseModel):
 			raise ValueError('Value must be positive')
 
 		return value
+
 class SubmitAnswer(BaseModel):
 	page_idx: int
 	answers: list[AnswerSelection]
@@ -64,3 +86,22 @@ class SubmitAnswer(BaseModel):
 			raise ValueError('Duplicate question numbers are not allowed')
 
 		return answers
+
+class AssignBatch(BaseModel):
+	users: list[str]
+	quizzes: list[str]
+
+	@field_validator('users', 'quizzes')
+	def check_uids(cls, uids: list[str]) -> list[str]:
+		if not uids:
+			raise ValueError('At least one uid is required')
+
+		return list(dict.fromkeys(uids))
+
+class AssignResult(BaseModel):
+	created: int
+	skipped: int
+
+class GradeResult(BaseModel):
+	graded: int
+	scores: dict[str, float]
@@ -3,7 +3,11 @@ from ._quiz import (
 	QuizViewAdmin,
 	QuizViewStudent,
 	QuizViewTest,
-	SubmitAnswer
+	AnswerSelection,
+	SubmitAnswer,
+	AssignBatch,
+	AssignResult,
+	GradeResult
 )
 
 __all__ = [
@@ -11,5 +15,9 @@ __all__ = [
 	'QuizViewAdmin',
 	'QuizViewStudent',
 	'QuizViewTest',
-	'SubmitAnswer'
+	'AnswerSelection',
+	'SubmitAnswer',
+	'AssignBatch',
+	'AssignResult',
+	'GradeResult'
 ]
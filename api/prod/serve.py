@@ -0,0 +1,178 @@
+import gc, logging, os, random, signal, socket, time
+import uvicorn
+
+import config, database
+
+logger = logging.getLogger('uvicorn.error').getChild('serve')
+
+# the configured journal directory, before init_worker narrows it to one worker
+AUTOSAVE_ROOT = database.autosave.directory
+
+worker_index = 0
+worker_count = 1
+
+def init_worker(index: int, count: int) -> None:
+	"""
+	Gives the current process its worker identity: a distinct TSID node and autosave journal.
+
+	:param index: The 0-based worker index.
+	:param count: The number of workers.
+	"""
+
+	global worker_index, worker_count
+	worker_index, worker_count = index, count
+
+	# forked workers start with the random state of the supervisor
+	random.seed()
+
+	database.models.set_node(config.node_id + index)
+	database.autosave.directory = os.path.join(AUTOSAVE_ROOT, f'worker-{index}')
+
+def orphaned_journals() -> list[str]:
+	"""
+	Lists the autosave journals of workers beyond the current count that this worker takes over.
+	"""
+
+	root = AUTOSAVE_ROOT
+	if not os.path.isdir(root):
+		return []
+
+	# segments written before journals were kept per worker
+	orphans = [root] if worker_index == 0 else []
+
+	for name in sorted(os.listdir(root)):
+		prefix, _, suffix = name.partition('-')
+		if prefix != 'worker' or not suffix.isdigit():
+			continue
+
+		index = int(suffix)
+		if index >= worker_count and index % worker_count == worker_index:
+			orphans.append(os.path.join(root, name))
+
+	return orphans
+
+def _server(app, max_requests: int, **kwargs) -> uvicorn.Server:
+	return uvicorn.Server(uvicorn.Config(
+		app,
+		**kwargs,
+		log_level='info',
+		use_colors=True,
+		# spread recycling so workers do not restart together
+		limit_max_requests=max_requests + random.randint(0, config.max_requests_jitter) if max_requests else None
+	))
+
+class Supervisor():
+	"""
+	Pre-fork process manager serving one preloaded app from several workers on a shared socket.
+
+	The app is imported before forking, so its modules, models and schemas are
+	shared copy-on-write. Workers exit on their own after ``max_requests``
+	requests and are replaced under the same index, keeping their node id and
+	autosave journal.
+	"""
+
+	def __init__(self, host: str, port: int, workers: int, max_requests: int) -> None:
+		self.host = host
+		self.port = port
+		self.workers = workers
+		self.max_requests = max_requests
+
+		self._children: dict[int, tuple[int, float]] = {}
+		self._stopping = False
+
+	def run(self) -> None:
+		sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		sock.bind((self.host, self.port))
+		sock.listen(2048)
+		sock.set_inheritable(True)
+
+		from app import app
+
+		# objects surviving the preload are never collected, so collection in workers does not copy their pages
+		gc.freeze()
+
+		for index in range(self.workers):
+			self._spawn(app, sock, index)
+
+		signal.signal(signal.SIGTERM, self._stop)
+		signal.signal(signal.SIGINT, self._stop)
+
+		logger.info('Serving with %d workers on %s:%d', self.workers, self.host, self.port)
+
+		while self._children:
+			try:
+				pid, status = os.wait()
+			except ChildProcessError:
+				break
+			except InterruptedError:
+				continue
+
+			index, started = self._children.pop(pid, (None, 0.0))
+			if index is None or self._stopping:
+				continue
+
+			logger.info('Worker %d (pid %d) exited with status %d, replacing it', index, pid, os.waitstatus_to_exitcode(status))
+
+			# back off from workers that fail on start
+			if time.monotonic() - started < 1:
+				time.sleep(1)
+
+			self._spawn(app, sock, index)
+
+		sock.close()
+
+	def _spawn(self, app, sock: socket.socket, index: int) -> None:
+		pid = os.fork()
+
+		if pid:
+			self._children[pid] = (index, time.monotonic())
+			return
+
+		signal.signal(signal.SIGTERM, signal.SIG_DFL)
+		signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+		# never return into the supervisor loop, whatever happens in the worker
+		code = 1
+		try:
+			init_worker(index, self.workers)
+			_server(app, self.max_requests).run(sockets=[sock])
+			code = 0
+		except BaseException:
+			logger.exception('Worker %d failed', index)
+		finally:
+			# the replacement reuses this node id, and may not reissue uids of borrowed milliseconds
+			database.models.release_node()
+			os._exit(code)
+
+	def _stop(self, signum, _) -> None:
+		self._stopping = True
+
+		# a second SIGINT would make uvicorn skip its graceful shutdown
+		for pid in self._children:
+			try:
+				os.kill(pid, signal.SIGTERM)
+			except ProcessLookupError:
+				pass
+
+def serve(host: str, port: int, workers: int, max_requests: int) -> None:
+	"""
+	Serves the API, in-process for a single worker or from a pre-fork supervisor otherwise.
+
+	:param host: The address to bind.
+	:param port: The port to bind.
+	:param workers: The number of worker processes.
+	:param max_requests: Requests after which a worker is recycled, 0 to never recycle.
+	"""
+
+	if workers > 1 or max_requests:
+		Supervisor(host, port, workers, max_requests).run()
+		return
+
+	init_worker(0, 1)
+
+	from app import app
+
+	_server(app, 0, host=host, port=port).run()
+
+	database.models.release_node()
@@ -0,0 +1,45 @@
+import logging, time
+
+# uvicorn only configures its own loggers, so log under them to be visible
+logger = logging.getLogger('uvicorn.error').getChild('startup')
+
+class StartupTimer():
+	"""
+	Records the duration of consecutive startup phases, measured from the import of this module.
+	"""
+
+	def __init__(self) -> None:
+		self.started = time.perf_counter()
+		self.phases: dict[str, float] = {}
+		self._last = self.started
+
+	def mark(self, phase: str) -> float:
+		"""
+		Ends a phase that began when the previous one ended.
+
+		:param phase: The phase name.
+		:return: The phase duration in seconds.
+		"""
+
+		now = time.perf_counter()
+		elapsed = now - self._last
+
+		self.phases[phase] = elapsed
+		self._last = now
+
+		logger.info('%s took %.1f ms', phase, elapsed * 1000)
+
+		return elapsed
+
+	def ready(self) -> float:
+		total = time.perf_counter() - self.started
+
+		logger.info(
+			'Ready for the first request after %.1f ms (%s)',
+			total * 1000,
+			', '.join(f'{phase}={elapsed * 1000:.1f}ms' for phase, elapsed in self.phases.items())
+		)
+
+		return total
+
+timer = StartupTimer()
@@ -0,0 +1,7 @@
+# the cases import the API, so they are loaded by __main__ once --app-dir is on the path
+from ._runner import compare, measure
+
+__all__ = [
+	'compare',
+	'measure'
+]
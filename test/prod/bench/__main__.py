@@ -0,0 +1,72 @@
+import argparse, fnmatch, json, os, platform, sys
+
+from ._runner import compare, measure
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+def _environment() -> dict:
+	return {
+		'machine': platform.machine(),
+		'processor': platform.processor(),
+		'python': platform.python_version()
+	}
+
+def _load(path: str) -> dict:
+	if not os.path.exists(path):
+		return {'environment': {}, 'results': {}}
+
+	with open(path, 'r') as f:
+		return json.load(f)
+
+def main():
+	parser = argparse.ArgumentParser(prog='python -m bench', description='Time the quiz domain hot paths')
+	parser.add_argument('--app-dir', default='../../api/prod', help='Source tree of the API')
+	parser.add_argument('--sizes', type=int, nargs='+', help='Question counts of the synthetic quizzes')
+	parser.add_argument('--filter', default='*', help='Glob of the benchmark names to run')
+	parser.add_argument('--uid-count', type=int, default=0, help='Ids created by each bulk uids.* benchmark, e.g. 1000000; 0 skips them')
+	parser.add_argument('--baseline', default=BASELINE)
+	parser.add_argument('--save', action='store_true', help='Store the results as the new baseline')
+	parser.add_argument('--threshold', type=float, default=0.25, help='Allowed slowdown over the baseline, as a fraction, on top of the measured noise')
+	parser.add_argument('--strict', action='store_true', help='Exit with an error on regressions instead of only reporting them')
+	args = parser.parse_args()
+
+	sys.path.insert(0, os.path.abspath(args.app_dir))
+	from ._cases import SIZES, cases
+
+	results = {}
+	for name, fn in cases(tuple(args.sizes or SIZES), args.uid_count).items():
+		if fnmatch.fnmatchcase(name, args.filter):
+			results[name] = measure(fn)
+			print(f'{name}: {results[name]["seconds"] * 1e6:.2f} us ±{results[name]["spread"] * 100:.0f}%', file=sys.stderr)
+
+	baseline = _load(args.baseline)
+
+	if args.save:
+		with open(args.baseline, 'w') as f:
+			json.dump({
+				'environment': _environment(),
+				'results': baseline['results'] | results
+			}, f, indent='\t', sort_keys=True)
+			f.write('\n')
+
+		print(json.dumps(results, indent='\t'))
+		return
+
+	if not baseline['results']:
+		print(f'No baseline at {args.baseline}, record one with --save', file=sys.stderr)
+		sys.exit(1 if args.strict else 0)
+
+	# timings only compare on the hardware and interpreter that recorded them
+	if baseline['environment'] != _environment():
+		print(f'Baseline was recorded on {baseline["environment"]}, results may not be comparable', file=sys.stderr)
+
+	regressions = compare(results, baseline['results'], args.threshold)
+
+	print(json.dumps({'results': results, 'regressions': regressions}, indent='\t'))
+
+	# micro-benchmarks on shared or throttled machines still drift, so failing is opt-in
+	if regressions and args.strict:
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
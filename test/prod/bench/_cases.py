@@ -0,0 +1,60 @@
+from typing import Callable
+
+from tsidpy import TSIDGenerator
+
+import auth
+from database.compiled import CompiledQuiz
+from database.models import Quiz, Question, UIDGenerator, generate_uid, generate_uids, increment_uid
+from database._session import _build_stmt
+
+from ._fixtures import synthetic_quiz
+
+SIZES = (10, 100, 1000, 10000)
+
+def _legacy_uids(count: int) -> list[str]:
+	# the former generate_uid, which built a generator per call
+	return [TSIDGenerator().create().to_string() for _ in range(count)]
+
+def _uid_generator(count: int) -> list[str]:
+	uid_generator = UIDGenerator()
+	return [uid_generator.create() for _ in range(count)]
+
+def cases(sizes: tuple[int, ...] = SIZES, uid_count: int = 0) -> dict[str, Callable[[], object]]:
+	"""
+	Builds the benchmarks keyed by name. Size-dependent ones are suffixed with the question count.
+
+	:param sizes: The question counts of the synthetic quizzes.
+	:param uid_count: The ids created by each bulk uid benchmark. These take seconds per call, so they only run when requested.
+	"""
+
+	uid = generate_uid()
+	small = synthetic_quiz(10)
+
+	res: dict[str, Callable[[], object]] = {
+		'Quiz.dump': small.dump,
+		'_build_stmt': lambda: _build_stmt(Quiz, [[Quiz.questions, Question.answers]], None, 'raise', uid=uid),
+		'auth.check_sanity': lambda: auth.check_sanity(uid),
+		'increment_uid': lambda: increment_uid(uid),
+		'generate_uid': generate_uid
+	}
+
+	if uid_count > 0:
+		res |= {
+			f'uids.tsidpy[{uid_count}]': lambda: _legacy_uids(uid_count),
+			f'uids.generate_uid[{uid_count}]': lambda: [generate_uid() for _ in range(uid_count)],
+			f'uids.generate_uids[{uid_count}]': lambda: generate_uids(uid_count),
+			f'uids.UIDGenerator[{uid_count}]': lambda: _uid_generator(uid_count)
+		}
+
+	for size in sizes:
+		db_quiz = synthetic_quiz(size)
+		compiled = CompiledQuiz(db_quiz)
+		permutation = compiled.permute(seed=1)
+
+		res |= {
+			f'CompiledQuiz[{size}]': lambda q=db_quiz: CompiledQuiz(q),
+			f'CompiledQuiz.permute[{size}]': lambda c=compiled: c.permute(seed=1),
+			f'CompiledQuiz.q_select[{size}]': lambda c=compiled, p=permutation: c.q_select(page=0, permutation=p)
+		}
+
+	return res
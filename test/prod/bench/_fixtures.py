@@ -0,0 +1,50 @@
+import random
+
+from database.models import Quiz, Question, Answer, UIDGenerator
+
+def synthetic_quiz(
+	questions: int,
+	answers: int = 4,
+	per_page: int = 10,
+	shuffle: bool = True,
+	seed: int = 0
+) -> Quiz:
+	"""
+	Builds a transient quiz with its questions and answers, without a database.
+
+	:param questions: The number of questions, every one of which is selected.
+	:param answers: The number of answers per question.
+	:param per_page: The number of questions per page.
+	:param shuffle: Whether questions and answers are shuffled.
+	:param seed: The seed of the generated texts and correct answers.
+	:return: The quiz.
+	"""
+
+	rng = random.Random(seed)
+	uid_generator = UIDGenerator()
+
+	db_quiz = Quiz(
+		uid=uid_generator.create(),
+		title=f'Synthetic quiz of {questions}',
+		question_count=questions,
+		per_page=per_page,
+		shuffle_questions=shuffle,
+		shuffle_answers=shuffle
+	)
+
+	for q_idx in range(questions):
+		key = rng.randrange(answers)
+		db_quiz.questions.append(Question(
+			uid=uid_generator.create(),
+			text=f'Question {q_idx}: {rng.random()}',
+			answers=[
+				Answer(
+					uid=uid_generator.create(),
+					text=f'Answer {a_idx}',
+					correct=a_idx == key
+				)
+				for a_idx in range(answers)
+			]
+		))
+
+	return db_quiz
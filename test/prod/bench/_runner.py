@@ -0,0 +1,78 @@
+from typing import Callable
+import gc, statistics, time
+
+def measure(fn: Callable[[], object], target: float = 0.05, repeat: int = 15) -> dict[str, float]:
+	"""
+	Times a function, calling it in loops of at least ``target`` seconds.
+
+	:param fn: The function to time.
+	:param target: The minimum duration of a loop in seconds.
+	:param repeat: The number of loops.
+	:return: The median time per call in seconds across the loops, and their spread: the interquartile range relative to the median.
+	"""
+
+	# like timeit, keep collector pauses out of the timings
+	enabled = gc.isenabled()
+	gc.disable()
+
+	try:
+		times = _measure(fn, target, repeat)
+	finally:
+		if enabled:
+			gc.enable()
+
+	q1, median, q3 = statistics.quantiles(times, n=4)
+
+	return {
+		'seconds': median,
+		'spread': (q3 - q1) / median if median else 0.0
+	}
+
+def _measure(fn: Callable[[], object], target: float, repeat: int) -> list[float]:
+	number = 1
+	while True:
+		start = time.perf_counter()
+		for _ in range(number):
+			fn()
+		elapsed = time.perf_counter() - start
+
+		if elapsed >= target:
+			break
+		number *= 2 if elapsed == 0 else max(2, min(10, int(target / elapsed) + 1))
+
+	times = [elapsed / number]
+	for _ in range(repeat - 1):
+		start = time.perf_counter()
+		for _ in range(number):
+			fn()
+		times.append((time.perf_counter() - start) / number)
+
+	return times
+
+def compare(results: dict[str, dict[str, float]], baseline: dict[str, dict[str, float]], threshold: float) -> list[str]:
+	"""
+	Lists the benchmarks slower than their baseline by more than the threshold and the noise of both runs.
+
+	A slowdown only counts when it exceeds three times the combined spread of
+	the two measurements, so a noisy case is not reported for noise alone.
+
+	:param results: Results of measure keyed by benchmark name.
+	:param baseline: The baseline results keyed by benchmark name. Benchmarks without a baseline are skipped.
+	:param threshold: The allowed slowdown as a fraction, e.g. 0.25 for 25%.
+	:return: A description of each regression.
+	"""
+
+	regressions = []
+	for name, result in results.items():
+		base = baseline.get(name)
+		if not base or not base['seconds']:
+			continue
+
+		slowdown = result['seconds'] / base['seconds'] - 1
+		if slowdown > max(threshold, 3 * (result['spread'] + base['spread'])):
+			regressions.append(
+				f'{name}: {result["seconds"] * 1e6:.2f} us vs {base["seconds"] * 1e6:.2f} us baseline '
+				f'(+{slowdown * 100:.0f}%, spread {result["spread"] * 100:.0f}%/{base["spread"] * 100:.0f}%)'
+			)
+
+	return regressions
@@ -0,0 +1,87 @@
+import argparse, asyncio, json, time
+import httpx
+
+BASE_URL = 'http://api:8000'
+
+bench_user = 'bench_login'
+bench_pass = 'bench_login'
+
+def percentile(samples: list[float], pct: float) -> float:
+	if not samples:
+		return 0.0
+
+	ordered = sorted(samples)
+	idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+
+	return ordered[idx]
+
+def summary(samples: list[float]) -> dict:
+	return {
+		'count': len(samples),
+		'p50_ms': round(percentile(samples, 50) * 1000, 2),
+		'p95_ms': round(percentile(samples, 95) * 1000, 2),
+		'p99_ms': round(percentile(samples, 99) * 1000, 2),
+		'max_ms': round(max(samples, default=0.0) * 1000, 2)
+	}
+
+async def login(client: httpx.AsyncClient, samples: list[float], errors: list[int]) -> None:
+	payload = {
+		'username': bench_user,
+		'password': bench_pass
+	}
+
+	start = time.perf_counter()
+	response = await client.post('/token', data=payload)
+	samples.append(time.perf_counter() - start)
+
+	if response.status_code != 200:
+		errors.append(response.status_code)
+
+async def ping(client: httpx.AsyncClient, samples: list[float], done: asyncio.Event, interval: float) -> None:
+	while not done.is_set():
+		start = time.perf_counter()
+		await client.get('/')
+		samples.append(time.perf_counter() - start)
+
+		await asyncio.sleep(interval)
+
+async def run(base_url: str, logins: int, interval: float) -> dict:
+	limits = httpx.Limits(max_connections=logins + 1)
+
+	async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+		await client.post('/user', json={'username': bench_user, 'password': bench_pass})
+
+		login_samples: list[float] = []
+		ping_samples: list[float] = []
+		errors: list[int] = []
+
+		done = asyncio.Event()
+		pinger = asyncio.create_task(ping(client, ping_samples, done, interval))
+
+		start = time.perf_counter()
+		await asyncio.gather(*(login(client, login_samples, errors) for _ in range(logins)))
+		elapsed = time.perf_counter() - start
+
+		done.set()
+		await pinger
+
+	return {
+		'concurrent_logins': logins,
+		'elapsed_s': round(elapsed, 3),
+		'login': summary(login_samples),
+		'non_login': summary(ping_samples),
+		'errors': {str(code): errors.count(code) for code in set(errors)}
+	}
+
+def main():
+	parser = argparse.ArgumentParser(description='Measure login and non-login latency during a burst of logins')
+	parser.add_argument('--base-url', default=BASE_URL)
+	parser.add_argument('--logins', type=int, default=200)
+	parser.add_argument('--interval', type=float, default=0.01, help='Seconds between non-login probes')
+	args = parser.parse_args()
+
+	result = asyncio.run(run(args.base_url, args.logins, args.interval))
+	print(json.dumps(result, indent='\t'))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,195 @@
+import argparse, asyncio, json, os, sys, time
+
+from bench_login import summary
+
+def load_api(app_dir: str):
+	# the API is imported from its source tree so both paths share its engine and models
+	sys.path.insert(0, os.path.abspath(app_dir))
+
+	import database
+	return database
+
+class RoundTrips():
+	"""
+	Counts statements sent to the server by an engine, including flushes but not BEGIN and COMMIT.
+	"""
+
+	def __init__(self, engine) -> None:
+		from sqlalchemy import event
+
+		self.count = 0
+		event.listen(engine.sync_engine, 'before_cursor_execute', self._count)
+
+	def _count(self, *_) -> None:
+		self.count += 1
+
+async def setup(database, args) -> tuple[str, list[str], list[list[tuple[str, list[str]]]]]:
+	"""
+	Creates the students and a quiz without going through the API.
+
+	:return: The quiz uid, the student uids and each page's (question uid, answer uids).
+	"""
+
+	uid_generator = database.models.UIDGenerator()
+	quiz_uid = uid_generator.create()
+
+	users = [{
+		'uid': uid_generator.create(),
+		'username': f'{args.prefix}_{i}',
+		'hashed_pw': '-'
+	} for i in range(args.students)]
+
+	questions, answers, pages = [], [], []
+	for q_idx in range(args.pages * args.per_page):
+		question_uid = uid_generator.create()
+		questions.append({'uid': question_uid, 'quiz_uid': quiz_uid, 'text': f'Question {q_idx}'})
+
+		answer_uids = [uid_generator.create() for _ in range(4)]
+		answers += [{
+			'uid': answer_uid,
+			'question_uid': question_uid,
+			'text': f'Answer {a_idx}',
+			'correct': a_idx == 0
+		} for a_idx, answer_uid in enumerate(answer_uids)]
+
+		if q_idx % args.per_page == 0:
+			pages.append([])
+		pages[-1].append((question_uid, answer_uids))
+
+	async with database.DB() as db:
+		await db.insert_many(database.models.User, users)
+		await db.insert_many(database.models.Quiz, [{
+			'uid': quiz_uid,
+			'title': f'{args.prefix} quiz',
+			'question_count': len(questions),
+			'per_page': args.per_page
+		}])
+		await db.insert_many(database.models.Question, questions)
+		await db.insert_many(database.models.Answer, answers)
+
+	return quiz_uid, [user['uid'] for user in users], pages
+
+async def teardown(database, quiz_uid: str, user_uids: list[str]) -> None:
+	from sqlalchemy import delete, select
+
+	models = database.models
+
+	async with database.DB() as db:
+		await db.session.execute(delete(models.Submission).where(models.Submission.user_uid.in_(user_uids)))
+		await db.session.execute(delete(models.Answer).where(
+			models.Answer.question_uid.in_(select(models.Question.uid).where(models.Question.quiz_uid == quiz_uid))
+		))
+		await db.session.execute(delete(models.Question).where(models.Question.quiz_uid == quiz_uid))
+		await db.session.execute(delete(models.Quiz).where(models.Quiz.uid == quiz_uid))
+		await db.session.execute(delete(models.User).where(models.User.uid.in_(user_uids)))
+
+async def submit_select(database, user_uid: str, page: list[tuple[str, str]]) -> None:
+	# the former path: read the page's submissions, then mutate or add one ORM object per question
+	async with database.DB() as db:
+		subs = await db.query_list(
+			database.models.Submission,
+			user_uid=user_uid,
+			question_uid=[question_uid for question_uid, _ in page]
+		)
+		sub_dict = {sub.question_uid: sub for sub in subs}
+
+		for question_uid, answer_uid in page:
+			if question_uid in sub_dict:
+				sub_dict[question_uid].answer_uid = answer_uid
+			else:
+				db.session.add(database.models.Submission(
+					user_uid=user_uid,
+					question_uid=question_uid,
+					answer_uid=answer_uid
+				))
+
+async def submit_upsert(database, user_uid: str, page: list[tuple[str, str]]) -> None:
+	async with database.DB() as db:
+		await db.upsert_many(database.models.Submission, [{
+			'user_uid': user_uid,
+			'question_uid': question_uid,
+			'answer_uid': answer_uid
+		} for question_uid, answer_uid in page], update=['answer_uid'])
+
+PATHS = {
+	'select': submit_select,
+	'upsert': submit_upsert
+}
+
+async def bench_path(database, path: str, user_uids: list[str], pages: list, args) -> dict:
+	submit = PATHS[path]
+	trips = RoundTrips(database.get_engine())
+	gate = asyncio.Semaphore(args.concurrency)
+
+	samples: list[float] = []
+	errors: list[str] = []
+
+	async def student(s_idx: int, user_uid: str) -> None:
+		# every round answers each page again, so all but the first overwrite existing rows
+		for r_idx in range(args.rounds):
+			for page in pages:
+				answers = [(q_uid, a_uids[(s_idx + r_idx) % len(a_uids)]) for q_uid, a_uids in page]
+
+				async with gate:
+					start = time.perf_counter()
+					try:
+						await submit(database, user_uid, answers)
+					except Exception as e:
+						errors.append(type(e).__name__)
+					samples.append(time.perf_counter() - start)
+
+	start = time.perf_counter()
+	await asyncio.gather(*(student(i, uid) for i, uid in enumerate(user_uids)))
+	elapsed = time.perf_counter() - start
+
+	return {
+		'elapsed_s': round(elapsed, 3),
+		'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else 0.0,
+		'round_trips_per_submit': round(trips.count / len(samples), 2) if samples else 0.0,
+		'submit': summary(samples),
+		'errors': {name: errors.count(name) for name in set(errors)}
+	}
+
+async def run(args) -> dict:
+	database = load_api(args.app_dir)
+	await database.migrate()
+
+	res = {
+		'students': args.students,
+		'pages': args.pages,
+		'per_page': args.per_page,
+		'rounds': args.rounds,
+		'concurrency': args.concurrency
+	}
+
+	try:
+		for path in args.paths:
+			# fresh rows per path, so both start from an empty page and overwrite the same number of times
+			quiz_uid, user_uids, pages = await setup(database, args)
+
+			try:
+				res[path] = await bench_path(database, path, user_uids, pages, args)
+			finally:
+				await teardown(database, quiz_uid, user_uids)
+	finally:
+		await database.dispose_engine()
+
+	return res
+
+def main():
+	parser = argparse.ArgumentParser(description='Compare the select-then-write and upsert answer submission paths under concurrent submits')
+	parser.add_argument('--app-dir', default='../../api/prod', help='Source tree of the API')
+	parser.add_argument('--paths', nargs='+', choices=list(PATHS), default=list(PATHS))
+	parser.add_argument('--students', type=int, default=50)
+	parser.add_argument('--pages', type=int, default=5)
+	parser.add_argument('--per-page', type=int, default=10)
+	parser.add_argument('--rounds', type=int, default=2, help='Times each student submits every page')
+	parser.add_argument('--concurrency', type=int, default=20, help='Maximum submits in flight')
+	parser.add_argument('--prefix', default=f'bench_submit_{int(time.time()):x}', help='Prefix of created usernames and quiz titles')
+	args = parser.parse_args()
+
+	result = asyncio.run(run(args))
+	print(json.dumps(result, indent='\t'))
+
+if __name__ == '__main__':
+	main()
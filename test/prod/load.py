@@ -0,0 +1,288 @@
+import argparse, asyncio, contextlib, glob, json, math, os, random, sys, time
+import httpx
+
+from bench_login import summary
+
+BASE_URL = 'http://api:8000'
+
+admin_user = 'admin'
+admin_pass = 'admin'
+admin_code = 'admin_pw'
+
+class Recorder():
+	"""
+	Collects latencies and statuses per endpoint, labeled by route template rather than URL.
+	"""
+
+	def __init__(self) -> None:
+		self.samples: dict[str, list[float]] = {}
+		self.statuses: dict[str, dict[int, int]] = {}
+		self.failures: dict[str, int] = {}
+
+	async def call(
+		self,
+		client: httpx.AsyncClient,
+		label: str,
+		method: str,
+		url: str,
+		**kwargs
+	) -> httpx.Response | None:
+		start = time.perf_counter()
+
+		try:
+			response = await client.request(method, url, **kwargs)
+		except httpx.HTTPError:
+			self.failures[label] = self.failures.get(label, 0) + 1
+			return None
+
+		self.samples.setdefault(label, []).append(time.perf_counter() - start)
+
+		statuses = self.statuses.setdefault(label, {})
+		statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+		return response
+
+	def report(self, elapsed: float) -> dict:
+		endpoints = {}
+		total = errors = 0
+
+		for label in sorted(self.samples.keys() | self.failures.keys()):
+			statuses = self.statuses.get(label, {})
+			count = sum(statuses.values()) + self.failures.get(label, 0)
+			failed = sum(n for code, n in statuses.items() if code >= 400) + self.failures.get(label, 0)
+
+			total += count
+			errors += failed
+
+			endpoints[label] = {
+				**summary(self.samples.get(label, [])),
+				'throughput_rps': round(count / elapsed, 2) if elapsed else 0.0,
+				'error_rate': round(failed / count, 4) if count else 0.0,
+				'statuses': {str(code): n for code, n in sorted(statuses.items())},
+				'transport_errors': self.failures.get(label, 0)
+			}
+
+		return {
+			'elapsed_s': round(elapsed, 3),
+			'requests': total,
+			'throughput_rps': round(total / elapsed, 2) if elapsed else 0.0,
+			'error_rate': round(errors / total, 4) if total else 0.0,
+			'endpoints': endpoints
+		}
+
+def bearer(token: str) -> dict:
+	return {'Authorization': f'Bearer {token}'}
+
+async def login(client: httpx.AsyncClient, rec: Recorder, username: str, password: str) -> dict:
+	payload = {
+		'username': username,
+		'password': password
+	}
+
+	response = await rec.call(client, 'POST /token', 'POST', '/token', data=payload)
+	if response is None or response.status_code != 200:
+		raise RuntimeError(f'Login failed for {username}')
+
+	return bearer(response.json()['access_token'])
+
+async def setup(client: httpx.AsyncClient, rec: Recorder, args) -> tuple[list[tuple[str, str]], list[str]]:
+	"""
+	Creates the admin, the quizzes and the students, and assigns every quiz to every student.
+
+	:return: The (username, password) of each student and the quiz uids.
+	"""
+
+	await client.post('/user', json={'username': admin_user, 'password': admin_pass})
+	headers = await login(client, rec, admin_user, admin_pass)
+	await client.post(f'/admin/promote?code={admin_code}', headers=headers)
+	headers = await login(client, rec, admin_user, admin_pass)
+
+	fixtures = []
+	for path in sorted(glob.glob(os.path.join(args.fixtures, '*.json'))):
+		with open(path, 'r') as f:
+			fixtures.append(json.load(f))
+
+	quiz_uids = []
+	for i in range(args.quizzes):
+		body = {**fixtures[i % len(fixtures)], 'title': f'{args.prefix} quiz {i}'}
+		response = await client.post('/admin/quiz', json=body, headers=headers)
+		response.raise_for_status()
+		quiz_uids.append(response.text)
+
+	gate = asyncio.Semaphore(args.concurrency)
+	students = [(f'{args.prefix}_{i}', f'{args.prefix}_{i}') for i in range(args.students)]
+
+	async def create_student(username: str, password: str) -> str:
+		async with gate:
+			response = await rec.call(client, 'POST /user', 'POST', '/user', json={
+				'username': username,
+				'password': password
+			})
+
+		if response is None or response.status_code != 201:
+			raise RuntimeError(f'Could not create {username}')
+
+		return response.text
+
+	student_uids = await asyncio.gather(*(create_student(*s) for s in students))
+
+	response = await client.post('/admin/assign/batch', json={
+		'users': student_uids,
+		'quizzes': quiz_uids
+	}, headers=headers)
+	response.raise_for_status()
+
+	return students, quiz_uids
+
+async def take_quiz(
+	client: httpx.AsyncClient,
+	rec: Recorder,
+	gate: asyncio.Semaphore,
+	headers: dict,
+	quiz_uid: str,
+	think: float
+) -> None:
+	async def call(label: str, method: str, url: str, **kwargs) -> httpx.Response | None:
+		async with gate:
+			return await rec.call(client, label, method, url, headers=headers, **kwargs)
+
+	response = await call('GET /student/quiz/{uid}', 'GET', f'/student/quiz/{quiz_uid}')
+	if response is None or response.status_code != 200:
+		return
+
+	details = response.json()
+	pages = math.ceil(details['question_count'] / details['per_page'])
+
+	for page in range(pages):
+		response = await call(
+			'GET /student/quiz/{uid}/questions',
+			'GET',
+			f'/student/quiz/{quiz_uid}/questions?page={page}'
+		)
+		if response is None or response.status_code != 200:
+			return
+
+		questions = response.json()['questions']
+
+		if think:
+			await asyncio.sleep(random.uniform(0, 2 * think))
+
+		await call('POST /student/quiz/{uid}/submit', 'POST', f'/student/quiz/{quiz_uid}/submit', json={
+			'page_idx': page,
+			'answers': [
+				{
+					'question_idx': i,
+					'answer_idx': random.randrange(len(question['answers']))
+				}
+				for i, question in enumerate(questions)
+			]
+		})
+
+	await call('POST /student/quiz/{uid}/grade', 'POST', f'/student/quiz/{quiz_uid}/grade')
+
+async def student(
+	client: httpx.AsyncClient,
+	rec: Recorder,
+	gate: asyncio.Semaphore,
+	credentials: tuple[str, str],
+	quiz_uids: list[str],
+	think: float
+) -> None:
+	async with gate:
+		headers = await login(client, rec, *credentials)
+
+	async with gate:
+		await rec.call(client, 'GET /student/quiz', 'GET', '/student/quiz', headers=headers)
+
+	for quiz_uid in quiz_uids:
+		await take_quiz(client, rec, gate, headers, quiz_uid, think)
+
+async def exam(client: httpx.AsyncClient, args) -> dict:
+	setup_rec = Recorder()
+
+	start = time.perf_counter()
+	students, quiz_uids = await setup(client, setup_rec, args)
+	setup_elapsed = time.perf_counter() - start
+
+	rec = Recorder()
+	gate = asyncio.Semaphore(args.concurrency)
+	tasks = []
+
+	start = time.perf_counter()
+	for credentials in students:
+		tasks.append(asyncio.create_task(student(client, rec, gate, credentials, quiz_uids, args.think)))
+
+		# students arrive as a Poisson process, or all at once when the rate is 0
+		if args.arrival_rate > 0:
+			await asyncio.sleep(random.expovariate(args.arrival_rate))
+
+	results = await asyncio.gather(*tasks, return_exceptions=True)
+	elapsed = time.perf_counter() - start
+
+	return {
+		'students': args.students,
+		'quizzes': args.quizzes,
+		'concurrency': args.concurrency,
+		'arrival_rate': args.arrival_rate,
+		'failed_students': sum(isinstance(r, Exception) for r in results),
+		'setup': setup_rec.report(setup_elapsed),
+		'exam': rec.report(elapsed)
+	}
+
+@contextlib.asynccontextmanager
+async def open_client(args):
+	limits = httpx.Limits(max_connections=args.concurrency + 1)
+
+	if not args.asgi:
+		async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+			yield client
+		return
+
+	# in-process: the API is imported from its source tree and served without a socket,
+	# failing every route that issues more statements than it declares with db.expect
+	os.environ['QUERY_BUDGET'] = args.query_budget
+	sys.path.insert(0, os.path.abspath(args.app_dir))
+	from app import app
+
+	transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+
+	async with app.router.lifespan_context(app):
+		async with httpx.AsyncClient(transport=transport, base_url='http://asgi', timeout=args.timeout) as client:
+			yield client
+
+async def run(args) -> dict:
+	async with open_client(args) as client:
+		return await exam(client, args)
+
+def main():
+	parser = argparse.ArgumentParser(description='Simulate a class taking an exam and report latency per endpoint')
+	parser.add_argument('--base-url', default=BASE_URL)
+	parser.add_argument('--asgi', action='store_true', help='Serve the API in-process instead of over HTTP')
+	parser.add_argument('--app-dir', default='../../api/prod', help='Source tree of the API for --asgi')
+	parser.add_argument('--query-budget', choices=['off', 'warn', 'raise'], default='raise', help='QUERY_BUDGET of the API for --asgi')
+	parser.add_argument('--students', type=int, default=50)
+	parser.add_argument('--quizzes', type=int, default=2)
+	parser.add_argument('--concurrency', type=int, default=20, help='Maximum requests in flight')
+	parser.add_argument('--arrival-rate', type=float, default=10.0, help='Students starting per second, 0 for all at once')
+	parser.add_argument('--think', type=float, default=0.0, help='Mean seconds spent on a page before submitting')
+	parser.add_argument('--timeout', type=float, default=120.0)
+	parser.add_argument('--fixtures', default='json')
+	parser.add_argument('--prefix', default=f'load_{int(time.time()):x}', help='Prefix of created usernames and quiz titles')
+	args = parser.parse_args()
+
+	result = asyncio.run(run(args))
+	print(json.dumps(result, indent='\t'))
+
+	# with budgets raised, a server error is most likely a route over its statement budget
+	errors = sorted(
+		label
+		for phase in ('setup', 'exam')
+		for label, endpoint in result[phase]['endpoints'].items()
+		if any(code.startswith('5') for code in endpoint['statuses'])
+	)
+	if errors:
+		print(f'Server errors from: {", ".join(errors)}', file=sys.stderr)
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
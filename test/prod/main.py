@@ -9,6 +9,7 @@ admin_code = 'admin_pw'
 student_user = 'student'
 student_pass = 'student'
 jwt_headers = {}
+profile_headers = {'X-Query-Profile': '1'}
 
 def create_user(username: str, password: str) -> httpx.Response:
 	payload = {
@@ -45,10 +46,12 @@ def api_call(method: str, endpoint: str, body: dict | None = None) -> httpx.Resp
 			method,
 			f'{BASE_URL}{endpoint}',
 			json=body,
-			headers=jwt_headers
+			headers={**jwt_headers, **profile_headers}
 		)
 
 		print(f'Response: HTTP{response.status_code} {response.reason_phrase}')
+		if 'X-Query-Profile' in response.headers:
+			print(f'Query profile: {response.headers["X-Query-Profile"]}')
 		if response.text:
 			print(response.text)
 
@@ -99,6 +102,15 @@ def main():
 			}
 		]
 	})
+	api_call('POST', f'/student/quiz/{res.text}/autosave', {
+		"page_idx": 2,
+		"answers": [
+			{
+				"question_idx": 0,
+				"answer_idx": 1
+			}
+		]
+	})
 	api_call('POST', f'/student/quiz/{res.text}/submit', {
 		"page_idx": 2,
 		"answers": [